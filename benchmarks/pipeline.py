@@ -0,0 +1,240 @@
+from pathlib import Path
+import argparse
+import timeit
+import json
+import sys
+
+#The benchmark is run from the benchmarks folder or from the folder of the programs
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from qkd_numpy import sample_selection, measure_message_numpy
+import qkd_core as core
+import numpy as np
+
+#BENCHMARK OF THE STAGES OF THE PROTOCOLS
+#Every stage of the pipeline (encoding, measurement with every backend, sifting, sampling, QBER, Eve's key) and every
+#protocol end to end is timed at n = 1e3 ... 1e8 pulses. The inputs of a stage are built before it is timed, and every
+#stage is run as many times as needed to take at least 0.2 s, keeping the best of repeat runs to reduce the noise.
+#The results are compared with the baseline stored next to this file, so a change that makes a stage slower is reported
+#as a regression. Times depend on the machine, so the baseline should be updated (--update) on the machine where the
+#benchmark is tracked.
+#The circuit and hardware backends are much slower than NumPy, so they are only timed up to the sizes in MAX_PULSES.
+#The hardware backends run on the offline stand-in of qkd_fake_provider without queue latency, so they time the
+#building, transpilation and simulation of the jobs, not the queue of a real backend.
+
+#Baseline stored in the repository
+BASELINE = Path(__file__).resolve().parent / "pipeline_baseline.json"
+#Numbers of pulses of every stage
+SIZES = (10**3, 10**4, 10**5, 10**6, 10**7, 10**8)
+#Largest number of pulses timed for the benchmarks that are slow or use too much memory at 1e8 pulses
+MAX_PULSES = {
+    "measure_batched": 10**6,
+    "measure_aer": 10**4,
+    "measure_ibm_packed": 10**4,
+    "measure_ibm_dynamic": 10**4,
+    "measure_ibm": 10**3,
+    "run_bb84_pns": 10**7,
+    "run_decoy": 10**7,
+    "run_sarg04_tha": 10**7,
+}
+#Parameters of the end-to-end runs. n is chosen so that the number of pulses simulated is the size of the benchmark
+PARAMETERS = {"mu": 0.1, "eta_det": 0.1, "alpha": 0.25, "l": 80, "mu_decoy": 0.5, "percent_decoy": 30,
+              "percent_signal": 70, "engine": "numpy"}
+#Reference number of pulses sent to compute the fraction of them that are simulated
+REFERENCE_PULSES = 10**9
+
+#Random inputs shared by the stages, built once per size
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    bits = rng.integers(0, 2, size=n, dtype=np.uint8)
+    bases_Alice = rng.integers(0, 2, size=n, dtype=np.uint8)
+    bases_Bob = rng.integers(0, 2, size=n, dtype=np.uint8)
+
+    return rng, bits, bases_Alice, bases_Bob
+
+#Functions that prepare the inputs of a stage for n pulses and give the function that is timed
+def bench_encode(n):
+    _, bits, bases_Alice, _ = random_inputs(n)
+
+    return lambda: core.encode_message(bits, bases_Alice)
+
+def bench_measure(engine):
+    def bench(n):
+        rng, bits, bases_Alice, bases_Bob = random_inputs(n)
+        message = core.encode_message(bits, bases_Alice)
+        measure = core.engine_measure({"engine": engine}, rng)
+        return lambda: measure(message, bases_Bob)
+
+    return bench
+
+def bench_remove_garbage(n):
+    _, bits, bases_Alice, bases_Bob = random_inputs(n)
+
+    return lambda: core.remove_garbage(bases_Alice, bases_Bob, bits)
+
+def bench_remove_garbage_decoy(n):
+    rng, bits, bases_Alice, bases_Bob = random_inputs(n)
+    decoy = core.decoy_mask(int(0.3*n), n - int(0.3*n), rng)
+
+    return lambda: core.remove_garbage_decoy(bases_Alice, bases_Bob, bits, decoy)
+
+#Inputs of the SARG04 sifting: the sets of Alice and the guesses of Bob for n pulses
+def sarg04_inputs(n):
+    rng, bits, _, bases_Bob = random_inputs(n)
+    message = core.encode_message_sarg04(bits, rng)
+    sets = core.sets_sifting(message, rng)
+    states = core.states_guess(bases_Bob, measure_message_numpy(message, bases_Bob, rng))
+
+    return bits, bases_Bob, sets, states
+
+def bench_sifted_key(n):
+    bits, _, sets, states = sarg04_inputs(n)
+
+    return lambda: core.sifted_key(sets, states, bits)
+
+def bench_key_Eve(n):
+    bits, bases_Bob, sets, states = sarg04_inputs(n)
+    positions = core.sifted_key(sets, states, bits)[2]
+
+    return lambda: core.key_Eve(bases_Bob, positions)
+
+def bench_sample(n):
+    rng, bits, _, _ = random_inputs(n)
+    key = core.remove_garbage(np.zeros(n), np.zeros(n), bits)
+    selection = sample_selection(n, int(round((1/3)*n,0)), rng)
+
+    return lambda: core.sample(key, selection)
+
+def bench_QBER(n):
+    _, bits, bases_Alice, bases_Bob = random_inputs(n)
+    key_Alice = core.remove_garbage(np.zeros(n), np.zeros(n), bits)
+    key_Bob = core.remove_garbage(np.zeros(n), np.zeros(n), bits ^ (bases_Alice & bases_Bob))
+
+    return lambda: core.QBER(key_Alice, key_Bob)
+
+#Number of pulses sent by Alice so that about pulses are simulated, given the pulses simulated for REFERENCE_PULSES
+def pulses_sent(pulses, simulated_reference):
+    return max(1, int(round(pulses*REFERENCE_PULSES/simulated_reference)))
+
+def bench_run_bb84_pns(n):
+    p = PARAMETERS
+    simulated = core.pns_quantities(p["mu"], p["eta_det"], REFERENCE_PULSES, p["alpha"])["n_pns_fibra"]
+    params = {**p, "n": pulses_sent(n, simulated)}
+    rng = np.random.default_rng(0)
+
+    return lambda: core.run_bb84_pns(params, rng)
+
+def bench_run_decoy(n):
+    p = PARAMETERS
+    quantities = core.decoy_quantities(p["mu"], p["eta_det"], REFERENCE_PULSES, p["alpha"], p["mu_decoy"],
+                                       p["percent_decoy"], p["percent_signal"])
+    simulated = sum(quantities[name] for name in ("n_2_decoy_fibra", "n_2_signal_fibra", "n_decoy_fibra_no_pns",
+                                                  "n_signal_fibra_no_pns"))
+    params = {**p, "n": pulses_sent(n, simulated)}
+    rng = np.random.default_rng(0)
+
+    return lambda: core.run_decoy(params, rng)
+
+def bench_run_sarg04_tha(n):
+    p = PARAMETERS
+    simulated = core.fiber_pulses(p["mu"], p["eta_det"], REFERENCE_PULSES, p["alpha"], p["l"])
+    params = {**p, "n": pulses_sent(n, simulated)}
+    rng = np.random.default_rng(0)
+
+    return lambda: core.run_sarg04_tha(params, rng)
+
+#Benchmarks by name, in the order of the pipeline
+BENCHMARKS = {
+    "encode": bench_encode,
+    "measure_numpy": bench_measure("numpy"),
+    "measure_batched": bench_measure("batched"),
+    "measure_aer": bench_measure("aer"),
+    "measure_ibm_packed": bench_measure("ibm_packed"),
+    "measure_ibm_dynamic": bench_measure("ibm_dynamic"),
+    "measure_ibm": bench_measure("ibm"),
+    "remove_garbage": bench_remove_garbage,
+    "remove_garbage_decoy": bench_remove_garbage_decoy,
+    "sifted_key": bench_sifted_key,
+    "sample": bench_sample,
+    "QBER": bench_QBER,
+    "key_Eve": bench_key_Eve,
+    "run_bb84_pns": bench_run_bb84_pns,
+    "run_decoy": bench_run_decoy,
+    "run_sarg04_tha": bench_run_sarg04_tha,
+}
+
+#Function to make the hardware backends run on the offline stand-in, without queue latency, instead of connecting
+#to IBM Quantum
+def offline_hardware():
+    from qkd_fake_provider import FakeHardware
+    import qkd_ibm
+    qkd_ibm.set_backend(FakeHardware(queue_latency=0, seed=1))
+
+    return None
+
+#Function to time one benchmark at n pulses. It gives the best time of one call in seconds and the pulses per second
+def measure_benchmark(name, n, repeat=3):
+    function = BENCHMARKS[name](n)
+    #The first call loads the backend and fills its caches (transpiled circuits, connection), which are not timed
+    function()
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= 0.2:
+            break
+        number *= 10 if elapsed < 0.02 else 2
+    best = min([elapsed] + timer.repeat(repeat - 1, number))/number
+
+    return {"seconds": best, "pulses_per_s": n/best}
+
+#Function to compare the results with the baseline. A regression is a stage slower than the baseline by more than
+#tolerance (a fraction) at the same number of pulses
+def compare(results, baseline, tolerance=0.25):
+    regressions = []
+    for name, sizes in results.items():
+        for n, result in sizes.items():
+            reference = baseline.get(name, {}).get(n)
+            if reference and result["seconds"] > reference["seconds"]*(1 + tolerance):
+                regressions.append(f"{name} at n = {int(n):.0e} takes {result['seconds']*1e3:.3f} ms, baseline "
+                                   f"{reference['seconds']*1e3:.3f} ms ({result['seconds']/reference['seconds']:.2f}x)")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the stages of the PNS, decoy-state and THA protocols")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help=f"benchmarks to run, from {list(BENCHMARKS)}")
+    parser.add_argument("--sizes", type=float, nargs="*", default=list(SIZES), help="numbers of pulses, 1e3 ... 1e8 by default")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of every benchmark, the best one is kept")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--all-sizes", action="store_true", help="also time the slow benchmarks above MAX_PULSES")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            sys.exit(f"ERROR: Unknown benchmark. Choose from {list(BENCHMARKS)}. Entered value: {name}")
+    if any(name.startswith("measure_ibm") for name in args.benchmarks):
+        offline_hardware()
+
+    results = {}
+    for name in args.benchmarks:
+        for n in sorted(int(size) for size in args.sizes):
+            if n > MAX_PULSES.get(name, n) and not args.all_sizes:
+                continue
+            result = measure_benchmark(name, n, args.repeat)
+            results.setdefault(name, {})[str(n)] = result
+            print(f"{name:<22} n = {n:<10.0e} {result['seconds']*1e3:12.3f} ms   {result['pulses_per_s']:10.3g} pulses/s", flush=True)
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    if args.update:
+        for name, sizes in results.items():
+            baseline.setdefault(name, {}).update(sizes)
+        BASELINE.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline written to {BASELINE}")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
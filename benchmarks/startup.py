@@ -0,0 +1,98 @@
+from pathlib import Path
+import subprocess
+import argparse
+import json
+import sys
+
+#STARTUP BENCHMARK OF THE ENTRY POINTS
+#Every entry point is imported in a fresh interpreter with python -X importtime, and the cumulative import time of the
+#module, whether it imported Qiskit and its heaviest imports are reported. The results are compared with the baseline
+#stored next to this file, so a change that makes the startup slower or brings Qiskit back into the analytic and NumPy
+#modes is reported as a regression. Times depend on the machine, so the baseline should be updated (--update) on the
+#machine where the benchmark is tracked.
+
+#Folder of the programs
+ROOT = Path(__file__).resolve().parent.parent
+#Baseline stored in the repository
+BASELINE = Path(__file__).resolve().parent / "startup_baseline.json"
+#Entry points, and whether they are allowed to import Qiskit when they start
+ENTRY_POINTS = {
+    "BB84_PNS_Decoy_ENGLISH": False,
+    "SAR04_THA_ENGLISH": False,
+    "qkd_montecarlo": False,
+    "qkd_sweep": False,
+    "qkd_batch": False,
+    "qkd_stream": False,
+    "qkd_core": False,
+    "BB84_PNS_Decoy": False,
+    "SAR04_THA": False,
+    "qkd_aer": True,
+}
+
+#Function to import a module in a fresh interpreter and read the report of -X importtime.
+#It gives the cumulative time of every module imported, in microseconds, and the cumulative time of the module itself
+def import_times(module):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        sys.exit(f"ERROR: The module {module} could not be imported. {process.stderr.strip().splitlines()[-1]}")
+    times = {}
+    total = None
+
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        #Modules imported at the top level have no indentation after the separator
+        if name[1:] == module:
+            total = int(cumulative)
+        times[name.strip()] = int(cumulative)
+
+    return total, times
+
+#Function to measure the startup of one entry point. The best of repeat imports is kept to reduce the noise
+def measure_startup(module, repeat=3):
+    best_total, best_times = min((import_times(module) for _ in range(repeat)), key=lambda result: result[0])
+    heaviest = sorted(((name, t) for name, t in best_times.items() if name != module), key=lambda item: -item[1])[:5]
+
+    return {"import_ms": best_total/1000,
+            "qiskit": any(name.split(".")[0] in ("qiskit", "qiskit_aer", "qiskit_ibm_runtime") for name in best_times),
+            "heaviest": [[name, t/1000] for name, t in heaviest]}
+
+#Function to compare the results with the baseline. A regression is an import slower than the baseline by more than
+#tolerance (a fraction) or an entry point that imports Qiskit when it is not allowed to
+def compare(results, baseline, tolerance=0.25):
+    regressions = []
+    for module, result in results.items():
+        if result["qiskit"] and not ENTRY_POINTS.get(module, True):
+            regressions.append(f"{module} imports Qiskit at startup")
+        if module in baseline and result["import_ms"] > baseline[module]["import_ms"]*(1 + tolerance):
+            regressions.append(f"{module} starts in {result['import_ms']:.1f} ms, baseline {baseline[module]['import_ms']:.1f} ms")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup benchmark of the entry points with python -X importtime")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS), help="entry points to measure")
+    parser.add_argument("--repeat", type=int, default=3, help="imports of every entry point, the best one is kept")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    results = {module: measure_startup(module, args.repeat) for module in args.modules}
+    for module, result in results.items():
+        heaviest = ", ".join(f"{name} {t:.1f} ms" for name, t in result["heaviest"][:3])
+        print(f"{module:<24} {result['import_ms']:8.1f} ms   Qiskit: {'yes' if result['qiskit'] else 'no ':<3}   heaviest: {heaviest}")
+
+    if args.update:
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        baseline.update(results)
+        BASELINE.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline written to {BASELINE}")
+    else:
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
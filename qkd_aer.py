@@ -0,0 +1,165 @@
+from qiskit import QuantumCircuit, transpile
+from qiskit.circuit import ParameterVector
+from qiskit_aer import AerSimulator
+from qiskit_aer.primitives import SamplerV2
+import numpy as np
+
+#BATCHED AER MEASUREMENT BY OUTCOME CLASS
+#Only four states (|0>,|1>,|+>,|->) can be prepared and only two bases (Z, X) can be used to measure them,
+#so every pulse of a BB84 or SARG04 message belongs to one of 8 classes (prepared state, measurement basis).
+#Instead of running one circuit per pulse, each of the 8 circuits is run once with as many shots as pulses in
+#its class, and the per-shot results are given back to the positions of those pulses.
+#States and bases use the integer codes of qkd_numpy: state = 2*basis + bit, basis 0 -> Z and 1 -> X.
+#The module also works as a measurement service: a single AerSimulator is kept for the whole process and each of
+#the 8 circuits is compiled only once. Messages are arrays of state codes and are never modified when measured.
+#The qubit by qubit measurement does not build a circuit per pulse either: a template circuit whose preparation and
+#measurement rotations are parameters is compiled once, and every pulse is one set of parameter values of a single PUB.
+#The same templates (with several qubits or several pulses per qubit) are used by the hardware modes of qkd_ibm.
+
+#Simulator shared by every measurement of the process
+_simulator = None
+#Compiled circuit for each (state, basis) pair
+_compiled_circuits = {}
+#Sampler of the qubit by qubit measurement
+_sampler = None
+#Compiled template of the qubit by qubit measurement
+_compiled_template = None
+#Template circuit with its preparation and measurement parameters for each (width, length)
+_templates = {}
+
+#Angles of the RY rotation that prepares every state from |0>, by state code: |0>, |1>, |+> and |->
+PREPARATION_ANGLES = np.array([0, np.pi, np.pi/2, -np.pi/2])
+#Angles of the RY rotation that takes every measurement basis to the Z basis, by basis: Z and X
+MEASUREMENT_ANGLES = np.array([0, -np.pi/2])
+
+#Function to build the circuit that prepares a state and measures it in a basis
+def state_circuit(state, basis):
+    #Create a qubit. By default it is in state |0>
+    qc = QuantumCircuit(1,1)
+    #The bit of the state is 1 for |1> and |->
+    if (state & 1):
+        qc.x(0)
+    #The state belongs to the X basis for |+> and |->
+    if (state >> 1):
+        qc.h(0)
+    qc.barrier()
+    #If the measurement basis is X, the transition from Z to X is achieved with a Hadamard gate
+    if (basis == 1):
+        qc.h(0)
+    qc.measure(0,0)
+
+    return qc
+
+#Function to get the simulator shared by every measurement. It is created the first time it is needed
+def get_simulator():
+    global _simulator
+    if _simulator is None:
+        _simulator = AerSimulator()
+
+    return _simulator
+
+#Function to get the compiled circuit that prepares a state and measures it in a basis. It is built only once
+def compiled_circuit(state, basis):
+    key = (int(state), int(basis))
+    if key not in _compiled_circuits:
+        _compiled_circuits[key] = transpile(state_circuit(*key), get_simulator())
+
+    return _compiled_circuits[key]
+
+#Function to build the template circuit of width qubits that measures length pulses on each of them. Pulse p is
+#prepared with RY(theta[p]) and rotated to the basis of Bob with RY(phi[p]) on qubit p % width, in step p // width, and
+#measured into the classical bit p. Between two steps the qubits are reset. It is built only once for every shape
+def template_circuit(width=1, length=1):
+    key = (width, length)
+    if key not in _templates:
+        pulses = width*length
+        theta = ParameterVector("theta", pulses)
+        phi = ParameterVector("phi", pulses)
+        qc = QuantumCircuit(width, pulses)
+        for step in range(length):
+            first = step*width
+            for i in range(width):
+                qc.ry(theta[first + i], i)
+            qc.barrier()
+            for i in range(width):
+                qc.ry(phi[first + i], i)
+            qc.measure(range(width), range(first, first + width))
+            #The last step does not need a reset
+            if (step < length - 1):
+                qc.reset(range(width))
+        _templates[key] = (qc, theta, phi)
+
+    return _templates[key]
+
+#Function to get the parameter values of a template for a message: one row per execution of the template, with the
+#angles of its pulses. The message is completed with |0> measured in Z up to a whole number of executions
+def template_bindings(theta, phi, message, bases):
+    pulses = len(theta)
+    padding = -message.size % pulses
+    states = np.concatenate([message, np.zeros(padding, dtype=np.uint8)]).reshape(-1, pulses)
+    bases = np.concatenate([bases, np.zeros(padding, dtype=np.uint8)]).reshape(-1, pulses)
+
+    return {tuple(theta): PREPARATION_ANGLES[states], tuple(phi): MEASUREMENT_ANGLES[bases]}
+
+#Function to convert the measured bits of the executions of a template (the BitArrays of the classical register of
+#its PUBs, in order) into an array with the bits of the size pulses of the message. The bits are unpacked with the
+#classical bit 0 first, so every execution gives its pulses in order, without going through bitstrings
+def template_bits(bit_arrays, size):
+    bits = np.concatenate([bit_array.to_bool_array(order="little").reshape(-1) for bit_array in bit_arrays])
+
+    return bits[:size].view(np.uint8)
+
+#Function to get the sampler of the qubit by qubit measurement. It is created the first time it is needed
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = SamplerV2()
+
+    return _sampler
+
+#Function to get the compiled template of the qubit by qubit measurement. It is compiled only once
+def compiled_template():
+    global _compiled_template
+    if _compiled_template is None:
+        _compiled_template = transpile(template_circuit()[0], get_simulator())
+
+    return _compiled_template
+
+#Function to measure the message qubit by qubit, one shot per qubit. Every qubit is one set of parameter values of
+#the compiled template, all of them in the same PUB
+def measure_message_aer(message, bases):
+    message = np.asarray(message, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=np.uint8)
+    #Nothing to measure
+    if (message.size == 0):
+        return np.empty(0, dtype=np.uint8)
+    _, theta, phi = template_circuit()
+    pub = (compiled_template(), template_bindings(theta, phi, message, bases))
+    result = get_sampler().run([pub], shots=1).result()
+
+    return template_bits([result[0].data.c], message.size)
+
+#Function to convert the memory of a job (one string '0' or '1' per shot) into an array of bits
+def memory_to_bits(memory):
+    return np.frombuffer("".join(memory).encode("ascii"), dtype=np.uint8) - ord("0")
+
+#Function to measure the whole message running only the 8 distinct circuits, each with shots = size of its class
+def measure_message_batched(message, bases, simulator=None):
+    message = np.asarray(message, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=np.uint8)
+    if simulator is None:
+        simulator = get_simulator()
+    measurements = np.empty(message.size, dtype=np.uint8)
+    #Class of every pulse, from 0 to 7
+    classes = 2*message + bases
+
+    for c in range(8):
+        positions = np.flatnonzero(classes == c)
+        #Classes without pulses are not run
+        if (positions.size == 0):
+            continue
+        result = simulator.run(compiled_circuit(c >> 1, c & 1), shots=positions.size, memory=True).result()
+        #Each shot is an independent measurement, so they are scattered back to the pulses of the class in order
+        measurements[positions] = memory_to_bits(result.get_memory())
+
+    return measurements
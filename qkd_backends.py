@@ -0,0 +1,67 @@
+import importlib
+import sys
+
+#REGISTRY OF SIMULATION BACKENDS, LOADED ON DEMAND
+#Importing Qiskit and Qiskit Aer takes a large part of the startup of the programs, and the analytic quantities and the
+#NumPy engine do not need them. Backends are registered by name with the place of their measuring function as
+#"module:function", and the module is only imported the first time the backend is used.
+#So the programs only import Qiskit when the user actually chooses a backend that runs circuits.
+#Every backend also has the fidelity it reaches and a cost, so a run can ask for a fidelity and get the cheapest
+#backend that reaches it.
+
+#Fidelities from the lowest to the highest:
+#   expected -> closed-form expected values of the keys and the QBER, no pulse is simulated
+#   sampled  -> every pulse is measured following Born's rule, with ideal devices
+#   circuit  -> every pulse is prepared and measured by a quantum circuit on a simulator
+#   hardware -> every pulse is prepared and measured by a quantum circuit on a real quantum computer
+FIDELITIES = ("expected", "sampled", "circuit", "hardware")
+
+#Registered backends: name -> place of the measuring function ("module:function", None for the analytic backend,
+#which does not measure pulses), fidelity and relative cost
+_engines = {
+    "analytic": {"target": None, "fidelity": "expected", "cost": 0},
+    "numpy": {"target": "qkd_numpy:measure_message_numpy", "fidelity": "sampled", "cost": 1},
+    "batched": {"target": "qkd_aer:measure_message_batched", "fidelity": "circuit", "cost": 2},
+    "aer": {"target": "qkd_aer:measure_message_aer", "fidelity": "circuit", "cost": 3},
+    "ibm_packed": {"target": "qkd_ibm:measure_message_ibm_packed", "fidelity": "hardware", "cost": 4},
+    "ibm_dynamic": {"target": "qkd_ibm:measure_message_ibm_dynamic", "fidelity": "hardware", "cost": 5},
+    "ibm": {"target": "qkd_ibm:measure_message_ibm", "fidelity": "hardware", "cost": 6},
+}
+#Measuring functions of the backends already loaded
+_loaded = {}
+
+#Function to register a new backend, or replace one, without importing its module
+def register_engine(name, target, fidelity="sampled", cost=1):
+    if fidelity not in FIDELITIES:
+        sys.exit(f"ERROR: Unknown fidelity. Choose one of {list(FIDELITIES)}. Entered value: {fidelity}")
+    _engines[name] = {"target": target, "fidelity": fidelity, "cost": cost}
+    _loaded.pop(name, None)
+
+    return None
+
+#Function to get the names of the registered backends
+def engine_names():
+    return list(_engines)
+
+#Function to get the fidelity of a backend
+def engine_fidelity(name):
+    return _engines[name]["fidelity"]
+
+#Function to get the cheapest backend whose fidelity is at least the one asked for
+def cheapest_engine(fidelity):
+    level = FIDELITIES.index(fidelity)
+    candidates = [name for name, engine in _engines.items() if FIDELITIES.index(engine["fidelity"]) >= level]
+
+    return min(candidates, key=lambda name: _engines[name]["cost"])
+
+#Function to get the measuring function of a backend, importing its module the first time.
+#The analytic backend gives None, since it does not measure pulses
+def load_engine(name):
+    if name not in _loaded:
+        target = _engines[name]["target"]
+        if target is None:
+            return None
+        module, function = target.split(":")
+        _loaded[name] = getattr(importlib.import_module(module), function)
+
+    return _loaded[name]
@@ -0,0 +1,123 @@
+from qkd_keys import PackedKey
+from qkd_cache import ResultCache, cache_key, backend_name
+from qkd_export import METRICS_FILE
+import qkd_core as core
+import qkd_profiling
+import numpy as np
+import argparse
+import json
+import sys
+import os
+
+#BATCH RUNNER FOR THE PNS, DECOY-STATE AND THA SIMULATIONS
+#Runs many scenarios in one process, without asking anything to the user, so the interpreter and the simulation
+#engines are only loaded once. The batch file is a JSON list of scenarios or a JSON Lines file with one scenario per
+#line. Each scenario names its protocol and gives its parameters, and optionally a seed and the engine or the fidelity
+#(the cheapest engine that reaches it is used), for example
+#   {"protocol": "sarg04_tha", "mu": 0.1, "eta_det": 0.1, "n": 1e6, "alpha": 0.25, "l": 80, "seed": 1}
+#The results are written as JSON Lines, one line per scenario in the same order. Keys are reported by their length.
+#Scenarios with a seed are kept in the cache of results of qkd_cache, so running them again (for example on the Aer
+#or IBM engines) takes their records from the cache. A scenario exported to a folder ("export") is only taken from the
+#cache if its record was exported to the same folder and the folder still holds the exported run, otherwise it is run
+#again to write it.
+
+#Protocols that can be run, by name, with the function that runs them
+PROTOCOLS = {
+    "bb84_pns": core.run_bb84_pns,
+    "decoy": core.run_decoy,
+    "sarg04_tha": core.run_sarg04_tha,
+}
+
+#Function to read the scenarios of the batch file, as a JSON list or as JSON Lines
+def read_scenarios(path):
+    with open(path) as f:
+        text = f.read()
+    try:
+        if text.lstrip().startswith("["):
+            return json.loads(text)
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    except json.JSONDecodeError as error:
+        sys.exit(f"ERROR: The batch file {path} is not a JSON list or JSON Lines file. {error}")
+
+#Function to turn the result of a protocol into values that can be written as JSON. Keys are replaced by their length
+def to_record(value):
+    if isinstance(value, dict):
+        return {name: to_record(v) for name, v in value.items()}
+    if isinstance(value, PackedKey):
+        return len(value)
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+#Function to tell if a record of the cache can be used for a run exported to the folder export. The record does not hold
+#the arrays, so it is only used if it was exported to the same folder and the folder still holds the exported run
+def exported_record(record, export):
+    if not export:
+        return True
+
+    return record["parameters"].get("export") == export and os.path.exists(os.path.join(export, METRICS_FILE))
+
+#Function to run one scenario. Invalid parameters do not stop the batch, the error is given in the record instead.
+#With a cache (a qkd_cache.ResultCache), scenarios with a seed are looked for in it before running them
+def run_scenario(scenario, cache=None):
+    params = dict(scenario)
+    protocol = params.pop("protocol", None)
+    seed = params.pop("seed", None)
+    if protocol not in PROTOCOLS:
+        return {"protocol": protocol, "status": f"ERROR: Unknown protocol. Choose one of {list(PROTOCOLS)}. Entered value: {protocol}"}
+    try:
+        if "n" in params:
+            params["n"] = int(params["n"])
+        key = None
+        if cache is not None and seed is not None:
+            key = cache_key(f"batch/{protocol}", params, seed, backend_name(core.select_engine(params)))
+            record = cache.get(key, lambda record: exported_record(record, params.get("export")))
+            if record is not None:
+                return record
+        result = PROTOCOLS[protocol](params, np.random.default_rng(seed))
+    except SystemExit as error:
+        return {"protocol": protocol, "parameters": scenario, "status": str(error)}
+    except KeyError as error:
+        return {"protocol": protocol, "parameters": scenario, "status": f"ERROR: Missing parameter {error}"}
+    except (TypeError, ValueError, ZeroDivisionError) as error:
+        return {"protocol": protocol, "parameters": scenario, "status": f"ERROR: Invalid parameters. {error}"}
+
+    record = {"protocol": protocol, "parameters": scenario, "status": "ok", **to_record(result)}
+    if key is not None:
+        cache.put(key, record)
+
+    return record
+
+#Function to run every scenario of the batch file and write one record per scenario to out
+def run_batch(path, out, cache=None):
+    scenarios = read_scenarios(path)
+    for scenario in scenarios:
+        out.write(json.dumps(run_scenario(scenario, cache)) + "\n")
+        out.flush()
+
+    return len(scenarios)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch runner of the PNS, decoy-state and THA simulations")
+    parser.add_argument("batch", help="JSON list or JSON Lines file with one scenario per entry")
+    parser.add_argument("--output", default=None, help="JSON Lines file for the results, the screen by default")
+    parser.add_argument("--cache", default=None, help="folder of the cache of results, QKD_CACHE or ~/.cache/qkd by default")
+    parser.add_argument("--no-cache", action="store_true", help="run every scenario again without using the cache of results")
+    parser.add_argument("--profile", default=None, help="JSON report with the time, throughput and memory of every stage")
+    parser.add_argument("--pstats", default=None, help="folder for the cProfile of every stage, with --profile")
+    args = parser.parse_args()
+    if args.profile:
+        qkd_profiling.enable(args.profile, args.pstats)
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+
+    if args.output is None:
+        run_batch(args.batch, sys.stdout, cache)
+    else:
+        with open(args.output, "w") as out:
+            print(f"{run_batch(args.batch, out, cache)} scenarios run and written to {args.output}")
+    #The records may be written to the screen, so the statistics of the cache go to the error output
+    if cache is not None:
+        print(cache.summary(), file=sys.stderr)
@@ -0,0 +1,159 @@
+from pathlib import Path
+import numpy as np
+import hashlib
+import json
+import os
+
+#CONTENT-ADDRESSED CACHE OF RESULTS
+#Running the same scenario again with the same seed gives the same result, and on the Aer and IBM backends it can take
+#hours or real device time. The runners keep their results in an on-disk cache, where every result is stored under the
+#SHA-256 of everything it depends on:
+#   kind     -> what is cached (a Monte Carlo scenario, a point of a sweep, a scenario of a batch...)
+#   params   -> the full parameter set (mu, eta_det, n, alpha, l, mu_decoy, percentages...), with numbers as floats
+#   seed     -> the seed of the random numbers. Runs without a seed can not be repeated, so they are never cached
+#   backend  -> the engine, and the offline fake backend when the hardware path runs offline
+#   code     -> the version of the code: the SHA-256 of the sources of the programs and the NumPy version, so any change
+#               of the code gives new keys and old results are never used
+#Every result is a JSON file <folder>/<first 2 digits of the key>/<key>.json. A hit updates the time of its file, so
+#when the cache is larger than its maximum size the least recently used results are removed first. Hits, misses,
+#writes and evictions are counted and reported by the runners.
+#The folder is given by the environment variable QKD_CACHE (~/.cache/qkd by default) and the size in MB by
+#QKD_CACHE_SIZE_MB.
+
+#Folder of the cache
+CACHE_DIR = os.environ.get("QKD_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "qkd"))
+#Maximum size of the cache in MB
+CACHE_SIZE_MB = float(os.environ.get("QKD_CACHE_SIZE_MB", 1024))
+#Parameters that do not change the result of a run and are left out of the keys
+IGNORED_PARAMETERS = ("export",)
+
+#Version of the code, computed the first time it is needed
+_code_version = None
+
+#Function to get the version of the code: the SHA-256 of the sources of the programs and the version of NumPy, whose
+#random number generators give the pulses
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256(np.__version__.encode())
+        for path in sorted(Path(__file__).resolve().parent.glob("*.py")):
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+        _code_version = digest.hexdigest()
+
+    return _code_version
+
+#Function to turn a seed into values that can be written as JSON: an integer, a list of integers or a SeedSequence,
+#which is given by its entropy and its spawn key
+def seed_value(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return {"entropy": seed_value(seed.entropy), "spawn_key": [int(k) for k in seed.spawn_key]}
+    if isinstance(seed, (list, tuple, np.ndarray)):
+        return [int(s) for s in seed]
+
+    return int(seed)
+
+#Function to get the name of the backend of an engine. The hardware engines add the offline fake backend if there is one
+def backend_name(engine):
+    offline = os.environ.get("QISKIT_IBM_OFFLINE", "")
+
+    return f"{engine}:{offline}" if engine.startswith("ibm") and offline else engine
+
+#Function to compute the key of a result from everything it depends on
+def cache_key(kind, params, seed, backend):
+    params = {name: float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, bool) else value
+              for name, value in params.items() if name not in IGNORED_PARAMETERS}
+    content = json.dumps({"kind": kind, "params": params, "seed": seed_value(seed), "backend": backend,
+                          "code": code_version()}, sort_keys=True)
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+#On-disk cache of results with a maximum size, evicting the least recently used results
+class ResultCache:
+
+    def __init__(self, folder=None, size_mb=None):
+        self.folder = Path(folder or CACHE_DIR)
+        self.max_bytes = int((CACHE_SIZE_MB if size_mb is None else size_mb)*2**20)
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        #Size of every result file, read from the folder the first time a result is written
+        self._sizes = None
+
+    def _path(self, key):
+        return self.folder / key[:2] / f"{key}.json"
+
+    #Function to get a result, None if it is not in the cache. valid, if given, tells if a stored result can still be
+    #used (for example if the files written with it still exist), and a result it rejects is a miss
+    def get(self, key, valid=None):
+        path = self._path(key)
+        try:
+            value = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stats["misses"] += 1
+            return None
+        if valid is not None and not valid(value):
+            self.stats["misses"] += 1
+            return None
+        #The time of the file marks it as recently used
+        os.utime(path)
+        self.stats["hits"] += 1
+
+        return value
+
+    #Function to store a result, removing the least recently used ones if the cache gets too large
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        #The result is written to a temporary file and renamed, so other processes never read half a result
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(value))
+        os.replace(temporary, path)
+        self.stats["writes"] += 1
+        if self._sizes is None:
+            self._sizes = self._scan()
+        self._sizes[path] = path.stat().st_size
+        if sum(self._sizes.values()) > self.max_bytes:
+            self.evict()
+
+        return None
+
+    #Function to read the size of every result file of the folder
+    def _scan(self):
+        return {path: path.stat().st_size for path in self.folder.glob("*/*.json")}
+
+    #Function to remove the least recently used results until the cache fits in its maximum size. The folder is read
+    #again, since other processes may have added or removed results
+    def evict(self):
+        files = []
+        for path in self.folder.glob("*/*.json"):
+            try:
+                status = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((status.st_mtime, status.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.stats["evictions"] += 1
+        self._sizes = self._scan()
+
+        return None
+
+    #Function to remove every result of the cache
+    def clear(self):
+        for path in self.folder.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+        self._sizes = {}
+
+        return None
+
+    #Function to describe the hits, misses, writes and evictions of the cache
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = f" ({self.stats['hits']/lookups*100:.1f} % hit rate)" if lookups else ""
+
+        return (f"Cache {self.folder}: {self.stats['hits']} hits, {self.stats['misses']} misses{rate}, "
+                f"{self.stats['writes']} writes, {self.stats['evictions']} evictions")
@@ -0,0 +1,630 @@
+from qkd_numpy import get_rng, encode_message_numpy, measure_message_numpy, sample_selection
+from qkd_backends import engine_names, load_engine, cheapest_engine, FIDELITIES
+from qkd_keys import PackedKey, count_errors
+from qkd_profiling import stage, profiled
+from qkd_export import export_run
+import numpy as np
+import math
+import sys
+import os
+
+#SHARED CORE OF THE BB84 (PNS ATTACK AND DECOY-STATE METHOD) AND SARG04 (THA ATTACK) SIMULATIONS
+#The eight scripts (Spanish and English, Aer and IBM) run the same protocols and only differ in the language of their
+#messages and in how the qubits are measured. Encoding, sifting, sampling, QBER and the quantities of the attacks live
+#here, and the measurement is done by one of the backends registered in qkd_backends:
+#   analytic -> closed-form expected values, no pulse is simulated
+#   numpy    -> vectorized NumPy measurement following Born's rule
+#   batched  -> the 8 (state, basis) circuits run on Aer
+#   aer      -> one shot per qubit of a parametrized template, every pulse bound in a single Aer PUB
+#   ibm      -> IBM Runtime, on a real quantum computer (also ibm_packed and ibm_dynamic, see qkd_ibm)
+#A run either names its engine or asks for a fidelity, and then the cheapest backend that reaches it is used.
+#Every run and every stage of a run is marked for the profiling of qkd_profiling, which costs nothing when disabled.
+
+#Functions that have a reference were taken from the Qiskit textbook. If they don't have a reference, they are original implementations
+#[1] https://github.com/Qiskit/textbook/blob/main/notebooks/ch-algorithms/quantum-key-distribution.ipynb
+
+#Messages of the validations, by check. They are formatted with the values checked, so the scripts in other languages
+#run the same validations with their own messages
+VALIDATION_MESSAGES = {
+    "mu_small": "ERROR:\u03BC too small. For this \u03BC almost all generated pulses have 0 average photons. Entered value: {mu}",
+    "mu_large": "ERROR:\u03BC MUST NOT be greater than 1. Remember!, it is a weak coherent pulse. Entered value: {mu}",
+    "eta_det": "ERROR: \u03B7_det must be between 0.05 and 1. Entered value: {eta_det}",
+    "alpha_negative": "ERROR: \u03B1 cannot be negative. Entered value: {alpha}",
+    "alpha_large": "ERROR: \u03B1 is not a realistic value. Too much attenuation to be practical. Try values near 0.25 in dB/km. Entered value: {alpha}",
+    "l_small": "ERROR: A minimum distance of 1 km is required. Otherwise, it makes no sense to run a QKD protocol. You could give the key in person. Try 100 in km. Entered value: {l}",
+    "l_large": "ERROR: The distance is too large. Try 50 in km. Entered value: {l}",
+    "n_small": "ERROR: n is too small. Try multiplying by 100 the value you entered. Number of bits that reach Bob after fiber attenuation: {n}",
+    "mu_decoy_large": "ERROR. \u03BC_decoy cannot be greater than 1. It must be a weak pulse. Entered value: {mu_decoy}",
+    "mu_decoy_small": "ERROR. \u03BC_decoy too small. Entered value: {mu_decoy}",
+    "mu_difference": "ERROR. The difference between \u03BC_decoy and \u03BC_signal must be larger to affect the statistics. Try \u03BC_decoy = {suggestion}. Entered value: \u03BC_decoy = {mu_decoy}, while \u03BC_signal = {mu}",
+    "percent_decoy": "ERROR. There must be a smaller percentage of decoy states than signal states so the protocol is not too inefficient. The final key is formed only with signal states, not decoys. Entered value: {percent_decoy}",
+    "percent_signal": "ERROR. There cannot be 100% signal states because the decoy-state method would not be used. Try 80% signal and 20% decoy. Entered value: {percent_signal}",
+    "percent_sum": "ERROR. The sum of percentages between signal and decoy states must equal 100%. Try 80% signal and 20% decoy. Entered values: decoy%={percent_decoy} and signal%={percent_signal}",
+    "engine": "ERROR: Unknown simulation engine. Choose one of {engines}. Entered value: {engine}",
+    "chunk_size": "ERROR: The chunk size cannot be negative. Use 0 to keep the whole run in memory. Entered value: {chunk_size}",
+}
+
+#Function to validate the average photon number. It is validated before computing the quantities of the attacks, which
+#are not defined for mu = 0
+def validate_mu(mu, messages=VALIDATION_MESSAGES):
+    #Conditions that the average photon number mu must satisfy (0<mu<0.5) --> practically restrict to (0.01<mu<0.5)
+    #If mu is too small, there are practically only empty pulses
+    if(mu<=0.01):
+        sys.exit(messages["mu_small"].format(mu=mu))
+    #If mu is too large, it is not considered the weak-pulse regime
+    if(mu>0.5):
+        sys.exit(messages["mu_large"].format(mu=mu))
+
+    return None
+
+#Function to validate the parameters entered by the user
+def validate_parameters(mu, n, eta_det, alpha, messages=VALIDATION_MESSAGES):
+    validate_mu(mu, messages)
+    #Conditions that the detector quantum efficiency eta_det must satisfy (0<eta_det<1) --> practically (0.05<eta_det<1)
+    if not (0.05<eta_det<=1):
+        sys.exit(messages["eta_det"].format(eta_det=eta_det))
+    #Fiber attenuation cannot be negative
+    if(alpha<0):
+        sys.exit(messages["alpha_negative"].format(alpha=alpha))
+    #Fiber attenuation cannot be too large.
+    if(alpha>0.5):
+        sys.exit(messages["alpha_large"].format(alpha=alpha))
+    #Condition to have a minimum number of bits in the final key. With 10 bits before distillation, the final key would have approximately 3 bits
+    if(n<10):
+        sys.exit(messages["n_small"].format(n=n))
+
+    return None
+
+#Function to validate the parameters used in the decoy-state method
+def decoy_validations(mu, mu_decoy, percent_decoy, percent_signal, messages=VALIDATION_MESSAGES):
+    #if the decoy mu is greater than one, it would not be in the weak-pulse regime
+    if(mu_decoy>1):
+        sys.exit(messages["mu_decoy_large"].format(mu_decoy=mu_decoy))
+    #For this implementation of the decoy-state method mu_decoy must be greater than 0
+    if(mu_decoy<0.1):
+        sys.exit(messages["mu_decoy_small"].format(mu_decoy=mu_decoy))
+    #If the difference between mu_decoy and mu_signal is not large enough, the detection statistics won't be significantly affected
+    if(abs(mu_decoy-mu)<0.1):
+        sys.exit(messages["mu_difference"].format(mu=mu, mu_decoy=mu_decoy, suggestion=mu_decoy+0.2))
+    #If there are too many decoy states, the protocol is inefficient because decoy states do not form part of the final key
+    if (percent_decoy>50):
+        sys.exit(messages["percent_decoy"].format(percent_decoy=percent_decoy))
+    #A maximum limit of 95% signal states is set so there is at least 5% decoy states
+    if(percent_signal>95):
+        sys.exit(messages["percent_signal"].format(percent_signal=percent_signal))
+    #If the sum of percentages of signal and decoy states does not equal 100, it makes no sense
+    if (percent_signal+percent_decoy!=100):
+        sys.exit(messages["percent_sum"].format(percent_decoy=percent_decoy, percent_signal=percent_signal))
+
+    return None
+
+#Function to validate the parameters of the SARG04 protocol entered by the user
+def validation_parameters(eta_det, n, alpha, l, mu, messages=VALIDATION_MESSAGES):
+    validate_mu(mu, messages)
+    #Conditions that the detector quantum efficiency eta_det must satisfy (0<eta_det<1) --> practically (0.05<eta_det<1)
+    if not (0.05<eta_det<=1):
+        sys.exit(messages["eta_det"].format(eta_det=eta_det))
+    #Fiber attenuation cannot be negative
+    if(alpha<0):
+        sys.exit(messages["alpha_negative"].format(alpha=alpha))
+    #Fiber attenuation cannot be too large.
+    if(alpha>0.5):
+        sys.exit(messages["alpha_large"].format(alpha=alpha))
+    #Distance cannot be too small
+    if(l<=1):
+        sys.exit(messages["l_small"].format(l=l))
+    #Distance cannot be too large; not realistic.
+    if(l>500):
+        sys.exit(messages["l_large"].format(l=l))
+    #Condition to have a minimum number of bits in the final key. With 10 bits before distillation, the final key would have approximately 3 bits
+    if(n<10):
+        sys.exit(messages["n_small"].format(n=n))
+
+    return None
+
+#Function to validate the simulation engine chosen by the user
+def validate_engine(engine, messages=VALIDATION_MESSAGES):
+    if engine not in engine_names():
+        sys.exit(messages["engine"].format(engines=engine_names(), engine=engine))
+
+    return None
+
+#Function to validate the chunk size of the streaming mode
+def validate_chunk_size(chunk_size, messages=VALIDATION_MESSAGES):
+    if(chunk_size<0):
+        sys.exit(messages["chunk_size"].format(chunk_size=chunk_size))
+
+    return None
+
+#Function to validate the fidelity asked for a run
+def validate_fidelity(fidelity):
+    if fidelity not in FIDELITIES:
+        sys.exit(f"ERROR: Unknown fidelity. Choose one of {list(FIDELITIES)}. Entered value: {fidelity}")
+
+    return None
+
+#Function to choose the engine of a run. params can name the engine or ask for a fidelity, and then the cheapest
+#backend that reaches that fidelity is chosen. Without any of them the vectorized NumPy engine is used
+def select_engine(params):
+    if "engine" in params:
+        validate_engine(params["engine"])
+        return params["engine"]
+    if "fidelity" in params:
+        validate_fidelity(params["fidelity"])
+        return cheapest_engine(params["fidelity"])
+
+    return "numpy"
+
+#Function to get the measuring function of the engine of a run. The NumPy engine draws its outcomes from rng.
+#The analytic engine has no measuring function and gives None, so the run computes the closed-form expected values
+def engine_measure(params, rng=None):
+    engine = select_engine(params)
+    if engine == "numpy":
+        return lambda message, bases: measure_message_numpy(message, bases, rng)
+
+    return load_engine(engine)
+
+#Function used by Alice to encode the message she wants to send [1]. Each qubit is kept as the code of the state
+#it is prepared in (0 -> |0>, 1 -> |1>, 2 -> |+>, 3 -> |->) instead of as a circuit, so measuring the message does
+#not modify it and Bob and Eve can both measure the same message
+def encode_message(bits,bases):
+    return encode_message_numpy(bits, bases)
+
+#Function for the distillation of the shared key between Alice and Bob [1].
+#If the basis bits match, keep the bits that belong to the final key string. The key is stored packed, 8 bits per byte
+def remove_garbage(bases_A, bases_B, bits):
+    keep = np.asarray(bases_A) == np.asarray(bases_B)
+
+    return PackedKey(np.asarray(bits)[keep])
+
+#Function to randomly distribute the decoy states through the message. The result is a mask that is True for
+#the pulses that are decoy states and False for the signal states, and it goes with the message until the sifting
+def decoy_mask(n_decoy, n_signal, rng=None):
+    decoy = np.zeros(n_decoy+n_signal, dtype=bool)
+    decoy[:n_decoy] = True
+    get_rng(rng).shuffle(decoy)
+
+    return decoy
+
+#Function for the special distillation of the shared key for the decoy-state method. Alice tells Bob which pulses
+#were decoy states, so the mask of decoy states is sifted together with the bits, keeping the positions where the bases match
+def remove_garbage_decoy(bases_A, bases_B, bits, decoy):
+    keep = np.asarray(bases_A) == np.asarray(bases_B)
+
+    return PackedKey(np.asarray(bits)[keep]), np.asarray(decoy)[keep]
+
+#Function to separate a sample from the distilled key and compute the QBER with that sample [2].
+#selection holds the positions of the sample and the positions of the rest of the key, as given by sample_selection,
+#so the key is split into the sample and the remaining key in one pass. It works for packed keys and for the mask of decoy states
+def sample(key,selection):
+    sample_positions, key_positions = selection
+
+    return key[sample_positions], key[key_positions]
+
+#Function to mark with True the positions of the sample given by sample_selection in a key of key_length bits
+def sample_mask(selection, key_length):
+    mask = np.zeros(key_length, dtype=bool)
+    mask[selection[0]] = True
+
+    return mask
+
+#Function to compute the QBER with the sample strings. The errors are counted on the packed keys with XOR and popcount.
+#An empty sample gives NaN, since no error can be estimated from it
+def QBER(sample_Alice, sample_Bob):
+    if len(sample_Alice) == 0:
+        return math.nan
+    error = count_errors(sample_Alice, sample_Bob)
+    #QBER is the number of errors counted in the sample divided by the sample length
+    return error/len(sample_Alice)
+
+#Function to compute the fraction of the final key that Eve knows
+def Eve_information(key_Alice, key_Eve):
+    if len(key_Alice) == 0:
+        return math.nan
+
+    return 1 - count_errors(key_Alice, key_Eve)/len(key_Alice)
+
+#Function to compute the yield of decoy states from the sifted mask of decoy states
+def yield_decoy_method(decoy):
+    n = len(decoy)
+    #Number of decoy states that arrive to Bob
+    yield_decoy = int(np.count_nonzero(decoy))
+    #The yield of signal states is the total states that arrive to Bob minus the decoy yield
+    yield_signal = n - yield_decoy
+    #Yields are calculated as the number of states Bob receives of each type divided by the total number of states he receives
+    return yield_decoy/n, yield_signal/n
+
+#Function to keep only the bits coming from signal states in the final key
+def key_signal_states(key, decoy):
+    return key[~np.asarray(decoy, dtype=bool)]
+
+#Function to compute the expected length of a key of n_sifted sifted bits once the sample of 1/3 is taken out of it
+def expected_key_length(n_sifted):
+    return n_sifted - int(round((1/3)*n_sifted,0))
+
+#Function to compute the probability of finding n photons in a coherent pulse
+def probability_photons(n,mu):
+    #Poisson distribution
+    P = (math.pow(mu,n)*math.exp(-mu))/(math.factorial(n))
+
+    return P
+
+#Function to compute the quantities of the PNS attack, which only depend on the source, the detector and the fiber.
+#They are the same ones the program computes step by step after the user enters the parameters
+def pns_quantities(mu, eta_det, n, alpha):
+    #Probabilities of finding 0, 1 and 2 or more photons
+    P_0 = probability_photons(0, mu)
+    P_1 = probability_photons(1, mu)
+    P_2_or_more = 1 - P_0 - P_1
+    #Normalized probabilities, since vacuum pulses are not used
+    P_1_nor = (P_1)/(P_1 + P_2_or_more)
+    P_2_or_more_nor = (P_2_or_more)/(P_1 + P_2_or_more)
+    #Number of bits that will come from a multiphoton pulse
+    n_pns = int(round(P_2_or_more_nor*n,0))
+    #Minimum attenuation so that Eve's intervention is not detected and the fiber length that meets it
+    delta_BB84 = 10*math.log10(mu/P_2_or_more)
+    l_BB84 = delta_BB84/alpha if alpha > 0 else math.inf
+    #Raw detection rate at Bob after the attack and number of bits that reach him
+    R_raw_pns = eta_det*P_2_or_more
+    n_pns_fibra = int(round(R_raw_pns*n_pns,0))
+
+    return {"P_0": P_0, "P_1": P_1, "P_2_or_more": P_2_or_more, "P_1_nor": P_1_nor, "P_2_or_more_nor": P_2_or_more_nor,
+            "n_pns": n_pns, "delta_BB84": delta_BB84, "l_BB84": l_BB84, "R_raw_pns": R_raw_pns, "n_pns_fibra": n_pns_fibra}
+
+#Function to compute the number of decoy and signal states that reach Bob in the decoy-state method,
+#with the PNS attack (n_2_decoy_fibra, n_2_signal_fibra) and without it (n_decoy_fibra_no_pns, n_signal_fibra_no_pns)
+def decoy_quantities(mu, eta_det, n, alpha, mu_decoy, percent_decoy, percent_signal):
+    pns = pns_quantities(mu, eta_det, n, alpha)
+    #Probabilities of finding 0, 1 and 2 or more photons in decoy pulses
+    P_0_decoy = probability_photons(0, mu_decoy)
+    P_1_decoy = probability_photons(1, mu_decoy)
+    P_2_or_more_decoy = 1 - P_0_decoy - P_1_decoy
+    P_1_nor_decoy = (P_1_decoy)/(P_1_decoy + P_2_or_more_decoy)
+    P_2_or_more_nor_decoy = (P_2_or_more_decoy)/(P_1_decoy + P_2_or_more_decoy)
+    #Number of bits that will come from decoy and signal states
+    n_decoy = int(round((percent_decoy/100)*n,0))
+    n_signal = int(round((percent_signal/100)*n,0))
+    #Bits of multiphoton and 1-photon pulses of each type
+    n_2_decoy = int(round(P_2_or_more_nor_decoy*n_decoy,0))
+    n_2_signal = int(round(pns["P_2_or_more_nor"]*n_signal,0))
+    n_1_decoy = int(round(P_1_nor_decoy*n_decoy,0))
+    n_1_signal = int(round(pns["P_1_nor"]*n_signal,0))
+    #With the PNS attack Eve only lets multiphoton pulses pass
+    R_raw_decoy = eta_det*P_2_or_more_decoy
+    n_2_decoy_fibra = int(round(R_raw_decoy*n_2_decoy,0))
+    n_2_signal_fibra = int(round(pns["R_raw_pns"]*n_2_signal,0))
+    #Without the attack every pulse goes through the fiber of minimum attenuation delta_BB84
+    R_raw_BB84 = eta_det*math.pow(10,-pns["delta_BB84"]/10)*mu
+    R_raw_BB84_decoy = eta_det*math.pow(10,-pns["delta_BB84"]/10)*mu_decoy
+    n_decoy_fibra_no_pns = int(round(R_raw_BB84_decoy*(n_2_decoy+n_1_decoy),0))
+    n_signal_fibra_no_pns = int(round(R_raw_BB84*(n_2_signal+n_1_signal),0))
+
+    return {"n_2_decoy_fibra": n_2_decoy_fibra, "n_2_signal_fibra": n_2_signal_fibra,
+            "n_decoy_fibra_no_pns": n_decoy_fibra_no_pns, "n_signal_fibra_no_pns": n_signal_fibra_no_pns}
+
+#Function to run the BB84 protocol with the PNS attack without asking anything to the user.
+#params holds mu, eta_det, n, alpha and optionally the engine and the folder where the run is exported (see qkd_export).
+#Invalid parameters stop the program with the same errors as the interactive program. The result holds the quantities
+#of the attack, the final keys and the QBER
+@profiled("bb84_pns")
+def run_bb84_pns(params, rng=None):
+    rng = get_rng(rng)
+    validate_mu(params["mu"])
+    quantities = pns_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"])
+    n_pulses = quantities["n_pns_fibra"]
+    validate_parameters(params["mu"], n_pulses, params["eta_det"], params["alpha"])
+    measure = engine_measure(params, rng)
+    #The analytic engine gives the expected values. Half of the pulses are measured in Alice's basis, and Eve, who
+    #measures with Bob's bases, always gets the bit Alice sent
+    if measure is None:
+        return {**quantities, "pulses": n_pulses, "final_key_length": expected_key_length(int(round(n_pulses/2))),
+                "QBER": 0.0, "Eve_information": 1.0}
+    with stage("encode", n_pulses):
+        #Random string containing the key Alice wants to send and random string for selecting her encoding bases
+        bits_pns_Alice = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        bases_pns_Alice = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        #Encoding the message in quantum states
+        message_pns = encode_message(bits_pns_Alice, bases_pns_Alice)
+    with stage("measure_Bob", n_pulses):
+        #Random string of Bob's measurement bases and resulting string after his measurement
+        bases_pns_Bob = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        results_pns_Bob = measure(message_pns, bases_pns_Bob)
+    with stage("measure_Eve", n_pulses):
+        #Eve had stored the quantum states from multiphoton pulses in a quantum memory, so she measures the same message
+        #as Bob. She knows the bases that were used to measure because she waited for the public discussion of the bases
+        results_pns_Eve = measure(message_pns, bases_pns_Bob)
+    with stage("remove_garbage", 3*n_pulses):
+        #Distillation of the keys via the public channel. Eve knows all the information exchanged over it
+        keys = {"Alice": remove_garbage(bases_pns_Alice, bases_pns_Bob, bits_pns_Alice),
+                "Bob": remove_garbage(bases_pns_Alice, bases_pns_Bob, results_pns_Bob),
+                "Eve": remove_garbage(bases_pns_Alice, bases_pns_Bob, results_pns_Eve)}
+    with stage("sample", 3*len(keys["Alice"])):
+        #Randomly choose, without replacement, a sample of length 1/3 of the distilled keys and remove it from the final keys
+        bit_selection_pns = sample_selection(len(keys["Alice"]), int(round((1/3)*len(keys["Alice"]),0)), rng)
+        samples = {}
+        for name in keys:
+            samples[name], keys[name] = sample(keys[name], selection=bit_selection_pns)
+    with stage("QBER", len(samples["Alice"])):
+        error = QBER(samples["Alice"], samples["Bob"])
+        information = Eve_information(keys["Alice"], keys["Eve"])
+
+    result = {**quantities, "pulses": n_pulses, "keys": keys, "final_key_length": len(keys["Alice"]),
+              "QBER": error, "Eve_information": information}
+    if params.get("export"):
+        with stage("export", n_pulses):
+            export_run(params["export"], {"bits_Alice": bits_pns_Alice, "bases_Alice": bases_pns_Alice,
+                                          "bases_Bob": bases_pns_Bob, "results_Bob": results_pns_Bob,
+                                          "results_Eve": results_pns_Eve, "sift_mask": bases_pns_Alice == bases_pns_Bob,
+                                          "sample_mask": sample_mask(bit_selection_pns, len(samples["Alice"]) + len(keys["Alice"]))},
+                       result)
+
+    return result
+
+#Function to run the decoy-state method with n_decoy decoy states and n_signal signal states reaching Bob.
+#If eavesdropper is True, Eve measures the photons she stole with Bob's bases as in the PNS attack.
+#If export is given, the run is exported to that folder
+def decoy_run(n_decoy, n_signal, measure, rng=None, eavesdropper=True, export=None):
+    rng = get_rng(rng)
+    n_pulses = n_decoy + n_signal
+    #The analytic engine gives the expected values. Sifting does not depend on the type of state, so the yields are
+    #the fractions of decoy and signal states that reach Bob
+    if measure is None:
+        n_key = expected_key_length(int(round(n_pulses/2)))
+        return {"pulses": n_pulses, "key_length_with_decoy": n_key,
+                "final_key_length": int(round(n_key*n_signal/n_pulses)) if n_pulses else 0, "QBER": 0.0,
+                "yield_decoy": n_decoy/n_pulses if n_pulses else math.nan,
+                "yield_signal": n_signal/n_pulses if n_pulses else math.nan}
+    with stage("encode", n_pulses):
+        #Bits Alice wants to send. The ones of signal states will form the shared private key
+        bits_method_Alice = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        #Mix the decoy and signal states randomly, marking the positions of the decoy states
+        decoy_method = decoy_mask(n_decoy, n_signal, rng)
+        #Random bases of Alice and encoding of the message
+        bases_method_Alice = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        message_method = encode_message(bits_method_Alice, bases_method_Alice)
+    with stage("measure_Bob", n_pulses):
+        #Random bases of Bob and his measurement
+        bases_method_Bob = rng.integers(0, 2, size=n_pulses, dtype=np.uint8)
+        results_method_Bob = measure(message_method, bases_method_Bob)
+    with stage("remove_garbage_decoy", 2*n_pulses):
+        #Distillation of the keys. Alice tells Bob which pulses were decoy states, so the mask is sifted with the bits
+        Alice_key_method, decoy_key_method = remove_garbage_decoy(bases_method_Alice, bases_method_Bob, bits_method_Alice, decoy_method)
+        keys = {"Alice": Alice_key_method,
+                "Bob": remove_garbage_decoy(bases_method_Alice, bases_method_Bob, results_method_Bob, decoy_method)[0]}
+    #Eve's PNS attack with the photons stolen from multiphoton pulses. Measuring does not modify the message,
+    #so Eve measures the same message as Bob once Alice and Bob share their bases
+    if eavesdropper:
+        with stage("measure_Eve", n_pulses):
+            results_method_Eve = measure(message_method, bases_method_Bob)
+        with stage("remove_garbage_decoy", n_pulses):
+            keys["Eve"] = remove_garbage_decoy(bases_method_Alice, bases_method_Bob, results_method_Eve, decoy_method)[0]
+    with stage("sample", (len(keys) + 1)*len(Alice_key_method)):
+        #Yield of decoy and signal states that reach Bob
+        yield_decoy_Bob, yield_signal_Bob = yield_decoy_method(decoy_key_method) if len(decoy_key_method) else (math.nan, math.nan)
+        #Randomly choose, without replacement, a sample of length 1/3 of the distilled keys and remove it from the keys.
+        #The mask of decoy states follows the same selection
+        bit_selection_method = sample_selection(len(Alice_key_method), int(round((1/3)*len(Alice_key_method),0)), rng)
+        samples = {}
+        for name in keys:
+            samples[name], keys[name] = sample(keys[name], selection=bit_selection_method)
+        _, decoy_key_method = sample(decoy_key_method, selection=bit_selection_method)
+        #Remove from the final keys the bits that came from decoy states
+        final_keys = {name: key_signal_states(key, decoy_key_method) for name, key in keys.items()}
+    with stage("QBER", len(samples["Alice"])):
+        error = QBER(samples["Alice"], samples["Bob"])
+
+    result = {"pulses": n_pulses, "keys": final_keys, "key_length_with_decoy": len(keys["Alice"]),
+              "final_key_length": len(final_keys["Alice"]), "QBER": error,
+              "yield_decoy": yield_decoy_Bob, "yield_signal": yield_signal_Bob}
+    if export:
+        with stage("export", n_pulses):
+            arrays = {"bits_Alice": bits_method_Alice, "bases_Alice": bases_method_Alice, "bases_Bob": bases_method_Bob,
+                      "results_Bob": results_method_Bob, "decoy_mask": decoy_method,
+                      "sift_mask": bases_method_Alice == bases_method_Bob,
+                      "sample_mask": sample_mask(bit_selection_method, len(Alice_key_method))}
+            if eavesdropper:
+                arrays["results_Eve"] = results_method_Eve
+            export_run(export, arrays, result)
+
+    return result
+
+#Function to run the decoy-state method without asking anything to the user. params holds mu, eta_det, n, alpha,
+#mu_decoy, percent_decoy, percent_signal and optionally the engine. The result holds the method under the PNS attack
+#("pns") and the statistics Alice and Bob would expect without the attack ("no_pns")
+@profiled("decoy")
+def run_decoy(params, rng=None):
+    rng = get_rng(rng)
+    validate_mu(params["mu"])
+    quantities = decoy_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"],
+                                  params["mu_decoy"], params["percent_decoy"], params["percent_signal"])
+    n_pns_fibra = pns_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"])["n_pns_fibra"]
+    validate_parameters(params["mu"], n_pns_fibra, params["eta_det"], params["alpha"])
+    decoy_validations(params["mu"], params["mu_decoy"], params["percent_decoy"], params["percent_signal"])
+    measure = engine_measure(params, rng)
+    #SITUATION 1) Eve tries to perform a PNS attack but Alice and Bob employ the decoy-state method along with BB84
+    with stage("pns") as frame:
+        pns = decoy_run(quantities["n_2_decoy_fibra"], quantities["n_2_signal_fibra"], measure, rng,
+                        export=params.get("export") and os.path.join(params["export"], "pns"))
+        frame["pulses"] = pns["pulses"]
+    #SITUATION 2) Statistics that would occur when applying the decoy-state method without a PNS attack
+    with stage("no_pns") as frame:
+        no_pns = decoy_run(quantities["n_decoy_fibra_no_pns"], quantities["n_signal_fibra_no_pns"], measure, rng, eavesdropper=False,
+                           export=params.get("export") and os.path.join(params["export"], "no_pns"))
+        frame["pulses"] = no_pns["pulses"]
+
+    #The pulses of the run are the ones simulated in both situations
+    result = {**quantities, "pulses": pns["pulses"] + no_pns["pulses"], "pns": pns, "no_pns": no_pns}
+    #The folder of the run holds the metrics of both situations, and their pulses are in the folders pns and no_pns
+    if params.get("export"):
+        export_run(params["export"], {}, result)
+
+    return result
+
+#States, bases, announced sets and Bob's guesses are all coded as small integers:
+#   states and guesses: 0 -> |0>, 1 -> |1>, 2 -> |+>, 3 -> |->   (the state codes of qkd_numpy)
+#   bases: 0 -> Z, 1 -> X
+#   sets: 2*z + x for the set {|z>, |x>} with z in {0, 1} and x = 0 for |+> or 1 for |->,
+#         that is 0 -> {|0>,|+>}, 1 -> {|0>,|->}, 2 -> {|1>,|+>}, 3 -> {|1>,|->}
+
+#Sift decision for every (announced set, Bob's guess). -1 discards the pulse and 0 or 1 is the bit Bob keeps.
+#If Bob's guess belongs to the set, he cannot be sure which state Alice actually sent because his measurement result
+#could come from either state, since in each set the states are non-orthogonal.
+#If he guessed |0> or |1> and it is not in the set, he knows he measured in the wrong basis (Z) since <1|0>=0.
+#The correct basis was X and he keeps a bit 1.
+#If he guessed |+> or |-> and it is not in the set, he knows he measured in the wrong basis (X) since <+|->=0.
+#The correct basis was Z and he keeps a bit 0
+SIFT_TABLE = np.array([
+    #guess: |0> |1> |+> |->
+            [-1,  1, -1,  0],   #set {|0>,|+>}
+            [-1,  1,  0, -1],   #set {|0>,|->}
+            [ 1, -1, -1,  0],   #set {|1>,|+>}
+            [ 1, -1,  0, -1],   #set {|1>,|->}
+], dtype=np.int8)
+
+#Function to compute how many bits survive after passing through the optical fiber which has a certain attenuation and
+#length. Detector efficiency is also taken into account. It is assumed Alice also sends this amount
+def fiber_pulses(mu, eta_det, n, alpha, l):
+    delta = alpha*l
+    R_raw_fibra = eta_det*math.pow(10,-delta/10)*mu
+
+    return int(round(R_raw_fibra*n))
+
+#Function for Bob to randomly choose the bases with which he measures
+def bases_choice(n, rng=None):
+    #Uniform random selection of Z basis (0) or X basis (1)
+    return get_rng(rng).integers(0, 2, size=n, dtype=np.uint8)
+
+#Function used by Alice to encode the message she wants to send in the SARG04 protocol. Each qubit is kept as the code
+#of the state it is prepared in instead of as a circuit, so measuring the message does not modify it
+def encode_message_sarg04(bits, rng=None):
+    bits = np.asarray(bits, dtype=np.uint8)
+    #Alice's bit selects the basis (0 -> Z, 1 -> X) and a uniform random bit selects the state within the basis
+    values = get_rng(rng).integers(0, 2, size=bits.size, dtype=np.uint8)
+
+    return encode_message_numpy(values, bits)
+
+#Function to create the sets of states that Alice sends over the public channel to Bob to begin the key sifting process.
+#The set always contains the state Alice sent and a random state of the other basis
+def sets_sifting(states, rng=None):
+    states = np.asarray(states, dtype=np.uint8)
+    coins = get_rng(rng).integers(0, 2, size=states.size, dtype=np.uint8)
+    #If Alice sent |0> or |1>, the set is {|0>,|+>} or {|0>,|->} (or the same with |1>)
+    #If Alice sent |+> or |->, the set is {|0>,|+>} or {|1>,|+>} (or the same with |->)
+    z = np.where(states < 2, states, coins)
+    x = np.where(states < 2, coins, states - 2)
+
+    return 2*z + x
+
+#Function with which Bob tries to guess which state Alice sent. It always follows the same idea:
+#if Bob had guessed the correct basis, the state sent by Alice can be deduced knowing the chosen basis and the measurement result.
+#The code of the guessed state is 2*basis + result
+def states_guess(bases, results):
+    return 2*np.asarray(bases, dtype=np.uint8) + np.asarray(results, dtype=np.uint8)
+
+#Function for sifting Bob's and Alice's keys. The decision for every pulse is taken from SIFT_TABLE
+def sifted_key(sets_Alice, states_Bob, bits_Alice):
+    decisions = SIFT_TABLE[np.asarray(sets_Alice), np.asarray(states_Bob)]
+    #Positions that Bob finally keeps
+    positions = np.flatnonzero(decisions >= 0)
+    good_bits_Bob = PackedKey(decisions[positions])
+    #Knowing the positions that Bob finally kept, filter Alice's key
+    good_bits_Alice = PackedKey(np.asarray(bits_Alice)[positions])
+
+    return good_bits_Bob, good_bits_Alice, positions
+
+#Function to mark with True the positions that Bob keeps in the sifting, out of n pulses
+def sift_mask(positions, n):
+    mask = np.zeros(n, dtype=bool)
+    mask[positions] = True
+
+    return mask
+
+#Function with which, if Eve performs a THA on Bob's basis selection, she can end up knowing the shared final key.
+#If the base chosen by Bob was Z, Eve records bit 1 and if it was X she records bit 0, because Bob keeps bits when he
+#measured in the wrong basis. Eve can know which positions to keep because Bob must provide this information to
+#Alice over the public channel
+def key_Eve(bases_Bob, positions):
+    return PackedKey(1 - np.asarray(bases_Bob, dtype=np.uint8)[positions])
+
+#Function to compute, from SIFT_TABLE, the probability that Bob keeps a pulse and the probabilities that a kept bit of
+#Bob or of Eve differs from Alice's bit. Every case (state sent, set announced, basis of Bob, result) is enumerated
+def sarg04_probabilities():
+    keep = error_Bob = error_Eve = 0.0
+    for state in range(4):
+        for coin in range(2):
+            #Set announced by Alice, built as in sets_sifting
+            z, x = (state, coin) if state < 2 else (coin, state - 2)
+            for basis in range(2):
+                for result in range(2):
+                    #Born's rule: the result is certain in the basis of the state and a fair coin in the other basis
+                    if basis == state >> 1:
+                        p_result = 1.0 if result == state & 1 else 0.0
+                    else:
+                        p_result = 0.5
+                    p = p_result/16
+                    decision = SIFT_TABLE[2*z + x, 2*basis + result]
+                    if p == 0 or decision < 0:
+                        continue
+                    keep += p
+                    #Alice's bit is the basis of the state she sent, and Eve records 1 - basis of Bob
+                    error_Bob += p*(decision != state >> 1)
+                    error_Eve += p*((1 - basis) != state >> 1)
+
+    return keep, float(error_Bob/keep), float(error_Eve/keep)
+
+#Function to run the SARG04 protocol with the THA attack without asking anything to the user.
+#params holds mu, eta_det, n, alpha, l and optionally the engine and the folder where the run is exported (see
+#qkd_export). Invalid parameters stop the program with the same errors as the interactive program. The result holds the
+#number of pulses that reach Bob, the final keys and the QBER
+@profiled("sarg04_tha")
+def run_sarg04_tha(params, rng=None):
+    rng = get_rng(rng)
+    n_fibra = fiber_pulses(params["mu"], params["eta_det"], params["n"], params["alpha"], params["l"])
+    #Validation of the parameters to be used in the protocol
+    validation_parameters(params["eta_det"], n_fibra, params["alpha"], params["l"], params["mu"])
+    measure = engine_measure(params, rng)
+    #The analytic engine gives the expected values from the probabilities of the sifting
+    if measure is None:
+        keep, error_Bob, error_Eve = sarg04_probabilities()
+        return {"pulses": n_fibra, "final_key_length": expected_key_length(int(round(keep*n_fibra))),
+                "QBER": error_Bob, "Eve_information": 1 - error_Eve}
+    with stage("encode", n_fibra):
+        #Alice's bits that she wants to send to Bob securely
+        bits_Alice_tha = rng.integers(0, 2, size=n_fibra, dtype=np.uint8)
+        #Encoding of the message by Alice in quantum states to send over the optical fiber
+        message_tha = encode_message_sarg04(bits_Alice_tha, rng)
+        #Sets that Alice will send over the public channel to sift the key. The message holds the code of the state of every qubit
+        sets_Alice_tha = sets_sifting(message_tha, rng)
+    with stage("measure_Bob", n_fibra):
+        #Random bases selected by Bob to measure the message arriving through the optical fiber and his results
+        bases_Bob_tha = bases_choice(n_fibra, rng)
+        results_Bob_tha = measure(message_tha, bases_Bob_tha)
+        #States Bob tries to guess as if they were those sent by Alice
+        states_Bob_tha = states_guess(bases_Bob_tha, results_Bob_tha)
+    with stage("sifted_key", n_fibra):
+        #Sifting of Alice's and Bob's keys with the states Bob attempts to guess and the sets Alice sends
+        Bob_key_tha, Alice_key_tha, positions_sift = sifted_key(sets_Alice_tha, states_Bob_tha, bits_Alice_tha)
+    with stage("key_Eve", n_fibra):
+        #Eve steals Bob's basis selection, so she knows the final key
+        keys = {"Alice": Alice_key_tha, "Bob": Bob_key_tha, "Eve": key_Eve(bases_Bob_tha, positions_sift)}
+    with stage("sample", 3*len(Alice_key_tha)):
+        #Randomly choose, without replacement, a sample of length 1/3 of the distilled keys and remove it from the final keys
+        bit_selection_tha = sample_selection(len(Alice_key_tha), int(round((1/3)*len(Alice_key_tha),0)), rng)
+        samples = {}
+        for name in keys:
+            samples[name], keys[name] = sample(keys[name], selection=bit_selection_tha)
+    with stage("QBER", len(samples["Alice"])):
+        error = QBER(samples["Alice"], samples["Bob"])
+        information = Eve_information(keys["Alice"], keys["Eve"])
+
+    result = {"pulses": n_fibra, "keys": keys, "final_key_length": len(keys["Alice"]),
+              "QBER": error, "Eve_information": information}
+    if params.get("export"):
+        with stage("export", n_fibra):
+            export_run(params["export"], {"bits_Alice": bits_Alice_tha, "states_Alice": message_tha,
+                                          "sets_Alice": sets_Alice_tha, "bases_Bob": bases_Bob_tha,
+                                          "results_Bob": results_Bob_tha, "sift_mask": sift_mask(positions_sift, n_fibra),
+                                          "sample_mask": sample_mask(bit_selection_tha, len(Alice_key_tha))},
+                       result)
+
+    return result
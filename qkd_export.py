@@ -0,0 +1,162 @@
+from qkd_output import key_fingerprint
+from qkd_keys import PackedKey
+from pathlib import Path
+import numpy as np
+import json
+import csv
+import sys
+import os
+
+#BINARY EXPORT OF THE RUNS AND TABLES
+#A run can keep its per-pulse arrays (Alice's bits and bases, Bob's bases, Bob's and Eve's outcomes, the mask of decoy
+#states, the sift mask and the sample mask) and its scalar metrics in a folder, given by the parameter "export" of the
+#run (or the environment variable QKD_EXPORT in the scripts, which export every run to a folder inside it):
+#   <folder>/<array>.npy  -> one raw .npy file per array, one element per pulse (the sample mask has one per sifted pulse)
+#   <folder>/pulses.npz   -> all the arrays in one compressed file instead, when compressed is True
+#   <folder>/metrics.json -> lengths, QBER, yields, Eve's information and the length and fingerprint of every key
+#The .npy files are opened lazily with np.load(path, mmap_mode="r"), which gives an np.memmap, so a run of 1e9 pulses
+#is analysed without loading it into memory. open_run does it for every array of a folder.
+#The streaming mode writes its blocks to the .npy files as they are produced with RunWriter, so the memory used does not
+#depend on the number of pulses either when exporting.
+#The tables of the sweeps are CSV, which can also be written as Parquet (typed columns, compressed) with pyarrow,
+#which is only needed, and imported, for that.
+
+#Folder where the scripts export their runs, empty to not export them
+EXPORT_DIR = os.environ.get("QKD_EXPORT", "")
+#Size of the header of the .npy files written by blocks. The shape is rewritten in it when the file is closed
+NPY_HEADER_SIZE = 128
+#File of the scalar metrics of a run
+METRICS_FILE = "metrics.json"
+#File of the arrays of a run when they are compressed
+COMPRESSED_FILE = "pulses.npz"
+
+#Function to get the folder where the scripts export the run name, None if they do not export it
+def export_folder(name):
+    return os.path.join(EXPORT_DIR, name) if EXPORT_DIR else None
+
+#Function to turn the result of a run into scalar metrics that can be written as JSON. Keys are replaced by their
+#length and fingerprint
+def run_metrics(result):
+    metrics = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            metrics[name] = run_metrics(value)
+        elif isinstance(value, PackedKey):
+            metrics[name] = {"length": len(value), "fingerprint": key_fingerprint(value)}
+        elif isinstance(value, np.generic):
+            metrics[name] = value.item()
+        elif isinstance(value, (int, float, str, bool)) or value is None:
+            metrics[name] = value
+
+    return metrics
+
+#Function to write the arrays and the metrics of a run to a folder, as raw .npy files or as one compressed .npz
+def export_run(folder, arrays, metrics, compressed=False):
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    if compressed:
+        np.savez_compressed(folder / COMPRESSED_FILE, **arrays)
+    else:
+        for name, values in arrays.items():
+            np.save(folder / f"{name}.npy", np.asarray(values))
+    (folder / METRICS_FILE).write_text(json.dumps(run_metrics(metrics), indent=2) + "\n")
+
+    return folder
+
+#Function to open a run exported to a folder. It gives its arrays, memory-mapped from the .npy files (or read lazily
+#from the .npz file), and its metrics
+def open_run(folder):
+    folder = Path(folder)
+    if not (folder / METRICS_FILE).exists():
+        sys.exit(f"ERROR: The folder {folder} does not hold an exported run")
+    metrics = json.loads((folder / METRICS_FILE).read_text())
+    if (folder / COMPRESSED_FILE).exists():
+        return np.load(folder / COMPRESSED_FILE), metrics
+
+    return {path.stem: np.load(path, mmap_mode="r") for path in sorted(folder.glob("*.npy"))}, metrics
+
+#Function to build the header of a .npy file of a one-dimensional array, padded to NPY_HEADER_SIZE bytes
+def npy_header(dtype, length):
+    description = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (length,)})
+    size = NPY_HEADER_SIZE - 10
+
+    return b"\x93NUMPY\x01\x00" + size.to_bytes(2, "little") + description.encode().ljust(size - 1) + b"\n"
+
+#Writer of a .npy file by blocks. The length is not known until the end, so the header is written again when closing
+class NpyWriter:
+
+    def __init__(self, path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self.file = open(path, "wb")
+        self.file.write(npy_header(self.dtype, 0))
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.length += values.size
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(npy_header(self.dtype, self.length))
+        self.file.close()
+
+#Writer of a run by blocks, for the streaming mode. Every array gets its own .npy file, created with the type of its
+#first block. The metrics are written when it is closed
+class RunWriter:
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.writers = {}
+
+    def __call__(self, **blocks):
+        for name, values in blocks.items():
+            if name not in self.writers:
+                self.writers[name] = NpyWriter(self.folder / f"{name}.npy", np.asarray(values).dtype)
+            self.writers[name].append(values)
+
+    def close(self, metrics):
+        for writer in self.writers.values():
+            writer.close()
+        (self.folder / METRICS_FILE).write_text(json.dumps(run_metrics(metrics), indent=2) + "\n")
+
+        return self.folder
+
+#Function to read a table of results from CSV or Parquet. It gives one NumPy array per column. Columns of numbers are
+#read as floats and the rest as text
+def read_table(path):
+    if str(path).endswith(".parquet"):
+        pyarrow_parquet = import_pyarrow_parquet()
+        table = pyarrow_parquet.read_table(path)
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+        columns = {name: [row[name] for row in rows] for name in (rows[0] if rows else {})}
+
+    table = {}
+    for name, values in columns.items():
+        try:
+            table[name] = np.array([float(value) if value != "" else np.nan for value in values])
+        except ValueError:
+            table[name] = np.array(values)
+
+    return table
+
+#Function to import pyarrow.parquet, which is only needed for Parquet tables
+def import_pyarrow_parquet():
+    try:
+        import pyarrow.parquet as pyarrow_parquet
+    except ImportError:
+        sys.exit("ERROR: Parquet tables need pyarrow. Install it (pip install pyarrow) or use the CSV table")
+
+    return pyarrow_parquet
+
+#Function to write a table of results (CSV or Parquet) as Parquet, with typed columns
+def write_parquet(table_path, output):
+    pyarrow_parquet = import_pyarrow_parquet()
+    import pyarrow
+    table = read_table(table_path)
+    pyarrow_parquet.write_table(pyarrow.table(table), output)
+
+    return output
@@ -0,0 +1,126 @@
+from qiskit.providers import BackendV2, Options
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel, ReadoutError
+import qiskit_ibm_runtime.fake_provider as fake_provider
+import threading
+import time
+import sys
+
+#OFFLINE STAND-IN FOR THE IBM QUANTUM SERVICE
+#The hardware path (qkd_ibm) needs a token and a network connection. This module gives a local stand-in for it, so the
+#batching, caching and packing of the hardware path can be benchmarked and tested on an offline machine:
+#   FakeHardware       -> backend with the qubits, coupling map, gate errors, durations and readout errors of a fake
+#                         backend of qiskit_ibm_runtime.fake_provider, simulated by Aer with its noise model. Every job
+#                         waits queue_latency seconds before running, as in the queue of a real backend, the PUBs per
+#                         job are limited as in the configuration of a real backend and the executions per job are
+#                         limited to max_executions. It counts the jobs, executions and time spent in the queue
+#   FakeRuntimeService -> service with the methods of QiskitRuntimeService used by qkd_ibm, which gives FakeHardware
+#                         backends
+#Setting the environment variable QISKIT_IBM_OFFLINE to the name of a fake backend (for example fake_sherbrooke) makes
+#qkd_ibm, and so the hardware scripts, use this service instead of the real one.
+#The states of the pulses are not entangled, so the simulator uses the matrix product state method, which runs the
+#127 qubits of the large backends where a statevector would not fit in memory.
+
+#Fake backend used when none is given
+DEFAULT_BACKEND = "fake_sherbrooke"
+#Seconds that every job waits in the queue
+QUEUE_LATENCY = 2.0
+#Maximum number of PUBs in one job, as the max_experiments of the configuration of the real backends
+MAX_PUBS = 300
+#Maximum number of executions (circuits times shots) in one job
+MAX_EXECUTIONS = 5000000
+
+#Function to get a fake backend of qiskit_ibm_runtime.fake_provider by its name, for example fake_sherbrooke for the
+#class FakeSherbrooke. Only that backend is built
+def fake_backend(name):
+    class_name = "".join(part.capitalize() for part in name.split("_"))
+    backend_class = getattr(fake_provider, class_name + "V2", None) or getattr(fake_provider, class_name, None)
+    if backend_class is None:
+        sys.exit(f"ERROR: Unknown fake backend. Use the name of a backend of qiskit_ibm_runtime.fake_provider, for example {DEFAULT_BACKEND}. Entered value: {name}")
+
+    return backend_class()
+
+#Configuration of the stand-in, with the limits that qkd_ibm reads from the real backends
+class FakeConfiguration:
+    def __init__(self, max_experiments):
+        self.max_experiments = max_experiments
+
+#Backend that simulates a fake backend with its noise, its queue latency and its job limits
+class FakeHardware(BackendV2):
+    def __init__(self, name=DEFAULT_BACKEND, queue_latency=QUEUE_LATENCY, max_pubs=MAX_PUBS,
+                 max_executions=MAX_EXECUTIONS, readout_error=None, seed=None):
+        backend = fake_backend(name)
+        super().__init__(name=f"offline_{backend.name}", backend_version="1.0")
+        #The noise model of the fake backend. With a readout error, the one of the fake backend is replaced by this
+        #error on every qubit
+        if readout_error is None:
+            noise_model = NoiseModel.from_backend(backend)
+        else:
+            noise_model = NoiseModel.from_backend(backend, readout_error=False)
+            noise_model.add_all_qubit_readout_error(ReadoutError([[1-readout_error, readout_error],
+                                                                  [readout_error, 1-readout_error]]))
+        self._simulator = AerSimulator.from_backend(backend, noise_model=noise_model, method="matrix_product_state",
+                                                    seed_simulator=seed)
+        self._configuration = FakeConfiguration(max_pubs)
+        self.queue_latency = queue_latency
+        self.max_executions = max_executions
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def _default_options(cls):
+        return Options(shots=1024, memory=False)
+
+    @property
+    def target(self):
+        return self._simulator.target
+
+    #The runtime primitives split the circuits of a job in runs of max_circuits. Without a limit every job is one run,
+    #so the queue latency is waited once per job
+    @property
+    def max_circuits(self):
+        return None
+
+    def configuration(self):
+        return self._configuration
+
+    #The runtime primitives copy the options of every job, backend included. A copy would not share the counters, so
+    #the backend is its own copy
+    def __deepcopy__(self, memo):
+        return self
+
+    #Function to set the counters of jobs, executions and queue time to zero
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"jobs": 0, "executions": 0, "queue_time": 0.0}
+
+        return None
+
+    #Function to run the circuits of a job. The job waits in the queue and is refused if it has too many executions
+    def run(self, run_input, **options):
+        circuits = run_input if isinstance(run_input, list) else [run_input]
+        executions = len(circuits)*options.get("shots", self.options.shots)
+        if executions > self.max_executions:
+            sys.exit(f"ERROR: The job has {executions} executions, the backend {self.name} accepts at most {self.max_executions}")
+        with self._lock:
+            self.stats["jobs"] += 1
+            self.stats["executions"] += executions
+            self.stats["queue_time"] += self.queue_latency
+        #Jobs submitted together wait in the queue at the same time
+        time.sleep(self.queue_latency)
+
+        return self._simulator.run(circuits, **options)
+
+#Service that gives FakeHardware backends, with the methods of QiskitRuntimeService used by qkd_ibm
+class FakeRuntimeService:
+    def __init__(self, name=DEFAULT_BACKEND, **backend_options):
+        self._backend = FakeHardware(name, **backend_options)
+
+    def backends(self, **filters):
+        return [self._backend]
+
+    def backend(self, name=None):
+        return self._backend
+
+    def least_busy(self, **filters):
+        return self._backend
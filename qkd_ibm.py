@@ -0,0 +1,227 @@
+from qiskit_ibm_runtime import QiskitRuntimeService, Batch
+from qiskit_ibm_runtime import SamplerV2 as Sampler
+from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+from qkd_aer import template_circuit, template_bindings, template_bits
+import numpy as np
+import sys
+import os
+
+#MEASUREMENT ON IBM QUANTUM COMPUTERS THROUGH QISKIT RUNTIME
+#Backend of the hardware scripts. No circuit is built or transpiled per pulse: the measurement is a template circuit of
+#qkd_aer whose preparation and measurement rotations are parameters, transpiled once for the backend, and the pulses are
+#given as arrays of parameter values, one row per execution of the template, in a few PUBs. The PUBs are submitted in
+#as few SamplerV2 jobs as the backend allows, all of them inside one Batch, so the run waits in the queue once instead
+#of once per qubit, and the results are given back to the pulses by their index.
+#Any backend can be used, for example a fake backend of qiskit_ibm_runtime.fake_provider to run it locally, and with
+#QISKIT_IBM_OFFLINE the whole hardware path runs on the offline stand-in of qkd_fake_provider.
+#The connection is kept for the whole process: the runtime service and the backend are found only once, and the pass
+#manager and the transpiled templates are built only once for every backend and optimization level. The BB84 script
+#measures three times (Bob, Eve and the decoy states) and repeats none of that work. The cache is invalidated with
+#reset_connection, for example after a new calibration of the backend or to change the account.
+#There are three modes, which only change the shape of the template:
+#   measure_message_ibm         -> one pulse per execution, on one qubit
+#   measure_message_ibm_packed  -> k pulses per execution on the k physical qubits of the coupling map with the best
+#                                  readout, so a 127-qubit backend runs about 100 times fewer executions. The states of
+#                                  the pulses are not entangled, so a fake 127-qubit backend can be simulated locally
+#                                  with AerSimulator.from_backend(backend, method="matrix_product_state"), with its noise
+#                                  and readout errors, where a statevector would not fit in memory
+#   measure_message_ibm_dynamic -> a sequence of pulses per execution on the qubit with the best readout, which is
+#                                  prepared, rotated to the basis of Bob, measured into the bit of the pulse and reset
+#                                  once per pulse, so one shot gives hundreds of outcomes. The length of the sequence is
+#                                  limited by the durations of the measurement and the reset of the backend. The
+#                                  circuits are the same on Aer, which also runs mid-circuit measurements and resets
+#States and bases use the integer codes of qkd_numpy: state = 2*basis + bit, basis 0 -> Z and 1 -> X.
+
+#Channel and token of the IBM Quantum account. The token is read from the environment so it is not written in the code
+CHANNEL = os.environ.get("QISKIT_IBM_CHANNEL", "ibm_quantum")
+TOKEN = os.environ.get("QISKIT_IBM_TOKEN", "")
+#Name of a fake backend to use the offline stand-in of qkd_fake_provider instead of the real service, empty to connect
+OFFLINE = os.environ.get("QISKIT_IBM_OFFLINE", "")
+#Optimization level of the transpilation for the real backend
+OPTIMIZATION_LEVEL = 2
+#Maximum number of PUBs in one job when the backend does not give its own limit
+MAX_PUBS_PER_JOB = 300
+#Maximum number of executions of the template (rows of parameter values) in one PUB
+MAX_EXECUTIONS_PER_PUB = 10000
+#Maximum readout error of the qubits used in the packed mode
+READOUT_ERROR_LIMIT = 0.05
+#Maximum number of pulses in the sequence of a dynamic circuit
+MAX_SEQUENCE_LENGTH = 500
+#Maximum duration in seconds of the sequence of a dynamic circuit, when the backend gives its durations
+MAX_SEQUENCE_DURATION = 1e-3
+
+#Runtime service of the account, shared by every measurement of the process
+_service = None
+#Backend used by every measurement of the process
+_backend = None
+#Pass manager for each (backend, optimization level, initial layout)
+_pass_managers = {}
+#Transpiled template for each (backend, optimization level, initial layout, width, length)
+_isa_templates = {}
+
+#Function to get the runtime service of the account, or the offline stand-in. It is connected the first time it is needed
+def get_service():
+    global _service
+    if _service is None and OFFLINE:
+        from qkd_fake_provider import FakeRuntimeService
+        _service = FakeRuntimeService(OFFLINE)
+    if _service is None:
+        _service = QiskitRuntimeService(channel=CHANNEL, token=TOKEN)
+
+    return _service
+
+#Function to get the backend of the measurements. The least busy real backend is looked for the first time only
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = get_service().least_busy(operational=True, simulator=False)
+
+    return _backend
+
+#Function to choose the backend of the measurements, for example a fake backend, without connecting to the service
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+    return None
+
+#Function to forget the service, the backend, the pass managers and the transpiled templates, so the next measurement
+#connects and transpiles again
+def reset_connection():
+    global _service, _backend
+    _service = None
+    _backend = None
+    _pass_managers.clear()
+    _isa_templates.clear()
+
+    return None
+
+#Function to get the pass manager of a backend and an optimization level, optionally with the physical qubits where
+#the qubits of the circuits must be placed. It is built only once
+def get_pass_manager(backend, optimization_level=OPTIMIZATION_LEVEL, initial_layout=None):
+    key = (backend.name, optimization_level, None if initial_layout is None else tuple(initial_layout))
+    if key not in _pass_managers:
+        _pass_managers[key] = generate_preset_pass_manager(optimization_level=optimization_level, backend=backend,
+                                                           initial_layout=initial_layout)
+
+    return _pass_managers[key]
+
+#Function to get the maximum number of PUBs that the backend accepts in one job
+def max_pubs_per_job(backend):
+    limit = getattr(backend, "max_circuits", None)
+    if limit is None and hasattr(backend, "configuration"):
+        limit = getattr(backend.configuration(), "max_experiments", None)
+
+    return limit or MAX_PUBS_PER_JOB
+
+#Function to run a list of PUBs on the backend with one shot each and give their results in the same order.
+#The list is split in as few jobs as the backend allows and every job is submitted before waiting for any result
+def run_pubs(pubs, backend):
+    size = max_pubs_per_job(backend)
+    results = []
+
+    with Batch(backend=backend) as batch:
+        sampler = Sampler(mode=batch)
+        jobs = [sampler.run(pubs[start:start+size], shots=1) for start in range(0, len(pubs), size)]
+        #The k-th PUB result of the j-th job is the PUB j*size + k
+        for job in jobs:
+            results.extend(job.result())
+
+    return results
+
+#Function to get the template of width qubits and length pulses per qubit transpiled for the backend, with the qubits
+#placed on the physical qubits of initial_layout if given. It is transpiled only once
+def isa_template(backend, width=1, length=1, initial_layout=None, optimization_level=OPTIMIZATION_LEVEL):
+    key = (backend.name, optimization_level, None if initial_layout is None else tuple(initial_layout), width, length)
+    if key not in _isa_templates:
+        pm = get_pass_manager(backend, optimization_level, initial_layout)
+        _isa_templates[key] = pm.run(template_circuit(width, length)[0])
+
+    return _isa_templates[key]
+
+#Function to build the PUBs of a message for a template: its transpiled circuit with the parameter values of at most
+#MAX_EXECUTIONS_PER_PUB executions each, in the order of the message
+def template_pubs(message, bases, backend, width=1, length=1, initial_layout=None):
+    isa_circuit = isa_template(backend, width, length, initial_layout)
+    _, theta, phi = template_circuit(width, length)
+    bindings = template_bindings(theta, phi, message, bases)
+    executions = len(bindings[tuple(theta)])
+
+    return [(isa_circuit, {name: values[start:start+MAX_EXECUTIONS_PER_PUB] for name, values in bindings.items()})
+            for start in range(0, executions, MAX_EXECUTIONS_PER_PUB)]
+
+#Function to measure the message with a template on the backend of the process (or on the backend given)
+def measure_template(message, bases, backend=None, width=1, length=1, initial_layout=None):
+    message = np.asarray(message, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=np.uint8)
+    #Nothing to submit
+    if (message.size == 0):
+        return np.empty(0, dtype=np.uint8)
+    if backend is None:
+        backend = get_backend()
+    pub_results = run_pubs(template_pubs(message, bases, backend, width, length, initial_layout), backend)
+
+    return template_bits([pub_result.data.c for pub_result in pub_results], message.size)
+
+#Function to measure the message on the backend of the process (or on the backend given), one shot per qubit
+def measure_message_ibm(message, bases, backend=None):
+    return measure_template(message, bases, backend)
+
+#Function to get the properties (duration and error) of an instruction of the backend on a qubit, None if the backend
+#does not give them, as simulators without noise
+def instruction_properties(target, name, qubit):
+    if name not in target.operation_names:
+        return None
+
+    return target[name].get((qubit,))
+
+#Function to choose the physical qubits of the packed mode: the qubits of the coupling map (qubits without any
+#connection are usually out of service) whose readout error is at most READOUT_ERROR_LIMIT, from the best readout to
+#the worst. width limits how many are used. If no qubit is good enough, the best one is used
+def packing_qubits(backend, width=None):
+    target = backend.target
+    coupling_map = backend.coupling_map
+    connected = sorted({q for edge in coupling_map.get_edges() for q in edge}) if coupling_map is not None else []
+    candidates = connected or list(range(backend.num_qubits))
+
+    def readout_error(q):
+        properties = instruction_properties(target, "measure", q)
+        if properties is None or properties.error is None:
+            return 0.0
+        return properties.error
+
+    candidates.sort(key=readout_error)
+    qubits = [q for q in candidates if readout_error(q) <= READOUT_ERROR_LIMIT] or candidates[:1]
+
+    return qubits[:width] if width else qubits
+
+#Function to measure the message in the packed mode, width pulses per execution on the qubits with the best readout.
+#Without a width, every good qubit of the backend is used
+def measure_message_ibm_packed(message, bases, backend=None, width=None):
+    if backend is None:
+        backend = get_backend()
+    qubits = packing_qubits(backend, width)
+
+    return measure_template(message, bases, backend, width=len(qubits), initial_layout=qubits)
+
+#Function to get the number of pulses of the sequence of a dynamic circuit on a qubit of the backend. Each pulse takes a
+#measurement and a reset, so the sequence is limited to MAX_SEQUENCE_DURATION when the backend gives their durations
+def sequence_length(backend, qubit):
+    target = backend.target
+    if "reset" not in target.operation_names:
+        sys.exit(f"ERROR: The backend {backend.name} does not support mid-circuit resets, the dynamic mode can not be used")
+    properties = [instruction_properties(target, name, qubit) for name in ("measure", "reset")]
+    durations = [None if p is None else p.duration for p in properties]
+    if None in durations:
+        return MAX_SEQUENCE_LENGTH
+
+    return max(1, min(MAX_SEQUENCE_LENGTH, int(MAX_SEQUENCE_DURATION/sum(durations))))
+
+#Function to measure the message in the dynamic mode, a sequence of pulses per execution on the qubit with the best
+#readout of the backend
+def measure_message_ibm_dynamic(message, bases, backend=None):
+    if backend is None:
+        backend = get_backend()
+    qubits = packing_qubits(backend, 1)
+
+    return measure_template(message, bases, backend, length=sequence_length(backend, qubits[0]), initial_layout=qubits)
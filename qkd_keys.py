@@ -0,0 +1,113 @@
+import numpy as np
+
+#BIT-PACKED KEYS
+#A key stored as a Python list of ints costs about 36 bytes per bit. PackedKey stores 8 bits per byte with np.packbits,
+#padded to whole 64-bit words, so the errors between two keys are counted word by word with XOR and popcount.
+#The padding bits after the last bit of the key are always 0, so they never count as errors.
+
+#Number of bits set in every possible byte, used to count bits when NumPy has no np.bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+#Function to count the bits set in an array of 64-bit words
+def popcount(words):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+
+    return int(_POPCOUNT_TABLE[words.view(np.uint8)].sum(dtype=np.int64))
+
+#Function to pack an array of bits into bytes padded to whole 64-bit words
+def pack_bits(bits):
+    packed = np.packbits(np.asarray(bits, dtype=np.uint8))
+    padding = (-packed.size) % 8
+
+    return np.concatenate([packed, np.zeros(padding, dtype=np.uint8)]) if padding else packed
+
+#Key of bits packed 8 per byte. It can be built from any sequence of 0s and 1s (list, NumPy array or another PackedKey)
+class PackedKey:
+
+    def __init__(self, bits=()):
+        if isinstance(bits, PackedKey):
+            self.data = bits.data.copy()
+            self.length = bits.length
+        else:
+            bits = np.asarray(bits, dtype=np.uint8).ravel()
+            self.data = pack_bits(bits)
+            self.length = int(bits.size)
+
+    #Key built directly from packed bytes. The bits after length are set to 0 to keep the padding clean
+    @classmethod
+    def from_packed(cls, data, length):
+        key = cls.__new__(cls)
+        key.length = int(length)
+        n_bytes = (key.length + 7)//8
+        key.data = np.zeros(-(-n_bytes//8)*8, dtype=np.uint8)
+        key.data[:n_bytes] = np.asarray(data, dtype=np.uint8)[:n_bytes]
+        if key.length % 8:
+            key.data[n_bytes-1] &= (0xFF << (8 - key.length % 8)) & 0xFF
+
+        return key
+
+    #Function to join several keys one after the other. If every key but the last one fills whole bytes,
+    #the packed bytes are joined directly without unpacking them
+    @classmethod
+    def concatenate(cls, keys):
+        keys = [key if isinstance(key, PackedKey) else PackedKey(key) for key in keys]
+        if all(key.length % 8 == 0 for key in keys[:-1]):
+            data = np.concatenate([key.data[:(key.length + 7)//8] for key in keys]) if keys else np.zeros(0, dtype=np.uint8)
+            return cls.from_packed(data, sum(key.length for key in keys))
+
+        return cls(np.concatenate([key.to_bits() for key in keys]))
+
+    #Function to unpack the key into an array with one bit per element
+    def to_bits(self):
+        return np.unpackbits(self.data, count=self.length)
+
+    def tolist(self):
+        return self.to_bits().tolist()
+
+    #Function to count the positions where this key and another one of the same length differ (XOR and popcount)
+    def errors(self, other):
+        other = other if isinstance(other, PackedKey) else PackedKey(other)
+        if other.length != self.length:
+            raise ValueError(f"Keys of different length cannot be compared: {self.length} and {other.length}")
+
+        return popcount(np.bitwise_xor(self.data.view(np.uint64), other.data.view(np.uint64)))
+
+    #Function to count the bits set to 1
+    def count_ones(self):
+        return popcount(self.data.view(np.uint64))
+
+    #Indexing with an integer gives a bit. Slices, index arrays and boolean masks give a new PackedKey.
+    #Slices that start at a byte boundary are taken directly from the packed bytes
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return int(self.to_bits()[index])
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1 and start % 8 == 0:
+                return PackedKey.from_packed(self.data[start//8:], max(0, stop - start))
+
+        return PackedKey(self.to_bits()[index])
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedKey):
+            return NotImplemented
+
+        return self.length == other.length and np.array_equal(self.data, other.data)
+
+    #The key is printed as a list of bits, the same as the keys stored as lists
+    def __str__(self):
+        return str(self.tolist())
+
+    def __repr__(self):
+        return f"PackedKey(length={self.length})"
+
+#Function to count the errors between two keys, packing them first if they are not PackedKey
+def count_errors(key_A, key_B):
+    return PackedKey(key_A).errors(key_B) if not isinstance(key_A, PackedKey) else key_A.errors(key_B)
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from qkd_cache import ResultCache, cache_key
+from statistics import NormalDist
+import qkd_core as core
+import qkd_profiling
+import numpy as np
+import argparse
+import math
+import sys
+import os
+
+#MONTE CARLO RUNNER FOR REPEATED TRIALS OF THE PNS, DECOY-STATE AND THA SIMULATIONS
+#Each script runs a single trial, so the QBER and yields it reports are single noisy samples.
+#This runner executes N independent trials of a scenario in a pool of processes and reports the mean of every
+#quantity with its confidence interval. Every trial gets its own random number generator, spawned from one
+#SeedSequence, so the trials are independent whichever process runs them and the whole run is reproducible from
+#a single seed. Trials run the protocols of qkd_core with the vectorized NumPy engine.
+#With a seed, the results of the trials are kept in the cache of results of qkd_cache, so running the same scenario
+#with the same parameters, trials and seed again only aggregates them.
+
+#Default parameters of the scenarios. They are the examples suggested by the scripts
+DEFAULT_PARAMETERS = {
+    "mu": 0.1,
+    "eta_det": 0.1,
+    "n": int(1e9),
+    "alpha": 0.25,
+    "l": 80,
+    "mu_decoy": 0.5,
+    "percent_decoy": 20,
+    "percent_signal": 80,
+}
+
+#Quantities returned by the trials of every scenario
+QUANTITIES = {
+    "bb84_pns": ["pulses", "final_key_length", "QBER", "Eve_information"],
+    "decoy_pns": ["pulses", "final_key_length", "QBER", "yield_decoy", "yield_signal"],
+    "decoy_no_pns": ["pulses", "final_key_length", "QBER", "yield_decoy", "yield_signal"],
+    "sarg04_tha": ["pulses", "final_key_length", "QBER", "Eve_information"],
+}
+
+#Function to keep the quantities of a scenario from the result of a run of the protocol
+def trial_quantities(scenario, result):
+    return {name: result[name] for name in QUANTITIES[scenario]}
+
+#Trial of the BB84 protocol under a PNS attack
+def bb84_pns_trial(params, rng):
+    return trial_quantities("bb84_pns", core.run_bb84_pns({**params, "engine": "numpy"}, rng))
+
+#Trial of the decoy-state method, with the PNS attack (pns=True) or without it (pns=False)
+def decoy_trial(params, rng, pns=True):
+    quantities = core.decoy_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"],
+                                       params["mu_decoy"], params["percent_decoy"], params["percent_signal"])
+    measure = core.engine_measure({"engine": "numpy"}, rng)
+    if pns:
+        result = core.decoy_run(quantities["n_2_decoy_fibra"], quantities["n_2_signal_fibra"], measure, rng)
+    else:
+        result = core.decoy_run(quantities["n_decoy_fibra_no_pns"], quantities["n_signal_fibra_no_pns"], measure, rng,
+                                eavesdropper=False)
+
+    return trial_quantities("decoy_pns", result)
+
+#Trial of the decoy-state method without a PNS attack, the statistics Alice and Bob expect
+def decoy_no_pns_trial(params, rng):
+    return decoy_trial(params, rng, pns=False)
+
+#Trial of the SARG04 protocol under a THA attack
+def sarg04_tha_trial(params, rng):
+    return trial_quantities("sarg04_tha", core.run_sarg04_tha({**params, "engine": "numpy"}, rng))
+
+#Scenarios that can be run, by name
+SCENARIOS = {
+    "bb84_pns": bb84_pns_trial,
+    "decoy_pns": decoy_trial,
+    "decoy_no_pns": decoy_no_pns_trial,
+    "sarg04_tha": sarg04_tha_trial,
+}
+
+#Function to validate the scenario and its parameters before starting the processes, with the validations of qkd_core
+def validate_scenario(scenario, params):
+    if scenario not in SCENARIOS:
+        sys.exit(f"ERROR: Unknown scenario. Choose one of {list(SCENARIOS)}. Entered value: {scenario}")
+    if scenario == "sarg04_tha":
+        n_pulses = core.fiber_pulses(params["mu"], params["eta_det"], params["n"], params["alpha"], params["l"])
+        core.validation_parameters(params["eta_det"], n_pulses, params["alpha"], params["l"], params["mu"])
+    else:
+        core.validate_mu(params["mu"])
+        n_pulses = core.pns_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"])["n_pns_fibra"]
+        core.validate_parameters(params["mu"], n_pulses, params["eta_det"], params["alpha"])
+    if scenario.startswith("decoy"):
+        core.decoy_validations(params["mu"], params["mu_decoy"], params["percent_decoy"], params["percent_signal"])
+
+    return None
+
+#Function executed by the processes of the pool. The generator of the trial is built from its own SeedSequence
+def run_trial(scenario, params, seed):
+    return SCENARIOS[scenario](params, np.random.default_rng(seed))
+
+#Function to aggregate the results of the trials into the mean, the standard deviation and the confidence interval
+#of the mean of every quantity. NaN values (empty samples) are left out
+def aggregate(results, confidence=0.95):
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    summary = {}
+
+    for name in results[0]:
+        values = np.array([result[name] for result in results], dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            summary[name] = {"mean": math.nan, "std": math.nan, "ci_low": math.nan, "ci_high": math.nan, "trials": 0}
+            continue
+        mean = float(values.mean())
+        std = float(values.std(ddof=1)) if values.size > 1 else 0.0
+        half_width = z*std/math.sqrt(values.size)
+        summary[name] = {"mean": mean, "std": std, "ci_low": mean - half_width, "ci_high": mean + half_width,
+                         "trials": int(values.size)}
+
+    return summary
+
+#Function to run N independent trials of a scenario in a pool of processes and aggregate their results.
+#workers=1 runs the trials in the current process. With a cache (a qkd_cache.ResultCache) and a seed, the results of
+#the trials are looked for in the cache before running them
+def run_trials(scenario, params=None, trials=100, workers=None, seed=None, confidence=0.95, cache=None):
+    params = {**DEFAULT_PARAMETERS, **(params or {})}
+    validate_scenario(scenario, params)
+    key = None
+    if cache is not None and seed is not None:
+        key = cache_key("montecarlo", {**params, "scenario": scenario, "trials": trials}, seed, "numpy")
+        results = cache.get(key)
+        if results is not None:
+            return aggregate(results, confidence)
+    #One independent stream of random numbers for every trial
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    workers = workers or os.cpu_count()
+
+    if workers == 1:
+        results = [run_trial(scenario, params, s) for s in seeds]
+    else:
+        #Trials are sent in chunks so that the cost of sending them to the processes is small
+        chunksize = max(1, trials//(4*workers))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_trial, [scenario]*trials, [params]*trials, seeds, chunksize=chunksize))
+    if key is not None:
+        cache.put(key, [{name: float(value) for name, value in result.items()} for result in results])
+
+    return aggregate(results, confidence)
+
+#Function to print the summary of a scenario
+def print_summary(scenario, summary, confidence):
+    print("")
+    print(f"Scenario {scenario}:")
+    for name, stats in summary.items():
+        print(f"    {name} = {stats['mean']:.6g} ± {stats['mean'] - stats['ci_low']:.3g} "
+              f"({int(confidence*100)}% CI [{stats['ci_low']:.6g}, {stats['ci_high']:.6g}], {stats['trials']} trials)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo runner for the PNS, decoy-state and THA simulations")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"scenarios to run, from {list(SCENARIOS)}")
+    parser.add_argument("--trials", type=int, default=100, help="number of independent trials of every scenario")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the SeedSequence the trials are spawned from")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the intervals")
+    parser.add_argument("--cache", default=None, help="folder of the cache of results, QKD_CACHE or ~/.cache/qkd by default")
+    parser.add_argument("--no-cache", action="store_true", help="run everything again without using the cache of results")
+    parser.add_argument("--profile", default=None, help="JSON report with the time, throughput and memory of every stage. The trials then run in this process")
+    parser.add_argument("--pstats", default=None, help="folder for the cProfile of every stage, with --profile")
+    for name, value in DEFAULT_PARAMETERS.items():
+        parser.add_argument(f"--{name}", type=float, default=value)
+    args = parser.parse_args()
+    #The stages of trials run by other processes would not be measured
+    if args.profile:
+        qkd_profiling.enable(args.profile, args.pstats)
+        args.workers = 1
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMETERS}
+    params["n"] = int(params["n"])
+    cache = None if args.no_cache else ResultCache(args.cache)
+
+    for scenario in args.scenarios:
+        summary = run_trials(scenario, params, args.trials, args.workers, args.seed, args.confidence, cache)
+        print_summary(scenario, summary, args.confidence)
+    if cache is not None:
+        print("")
+        print(cache.summary())
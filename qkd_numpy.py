@@ -0,0 +1,50 @@
+import numpy as np
+
+#VECTORIZED NUMPY ENGINE FOR THE PREPARATION AND MEASUREMENT OF BB84 STATES
+#Instead of building one QuantumCircuit per qubit, the whole message is handled as NumPy arrays.
+#Each prepared state is represented by an integer code:
+#   0 -> |0>    1 -> |1>    2 -> |+>    3 -> |->
+#and each measurement basis by an integer: 0 -> Z basis, 1 -> X basis.
+#The code of a state is 2*basis + bit, which is the same convention used by the scripts for Alice's bits and bases.
+
+#Function to get a random number generator. If the caller does not give one, a fresh one is created
+def get_rng(rng=None):
+    if rng is None:
+        return np.random.default_rng()
+
+    return rng
+
+#Function used by Alice to encode the whole message she wants to send in a single operation
+def encode_message_numpy(bits, bases):
+    bits = np.asarray(bits, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=np.uint8)
+    #State code of every qubit: the basis selects {|0>,|1>} or {|+>,|->} and the bit selects the state inside the basis
+    message = 2*bases + bits
+
+    return message
+
+#Function used to measure the whole message at once.
+#If the measurement basis matches the preparation basis, the result is the bit Alice encoded.
+#If they do not match, the result is a fair coin, exactly as Born's rule gives for |<0|+>|^2 = 1/2
+def measure_message_numpy(message, bases, rng=None):
+    rng = get_rng(rng)
+    message = np.asarray(message, dtype=np.uint8)
+    bases = np.asarray(bases, dtype=np.uint8)
+    #Basis in which each state was prepared and the bit it carries
+    prepared_bases = message >> 1
+    prepared_bits = message & 1
+    #Random outcomes for the qubits measured in the wrong basis
+    coins = rng.integers(0, 2, size=message.size, dtype=np.uint8)
+    measurements = np.where(prepared_bases == bases, prepared_bits, coins)
+
+    return measurements
+
+#Function to choose the positions of the sample used to estimate the QBER. The positions are drawn without
+#replacement from a random permutation and marked in a mask, so the key is split into the sample and the rest
+#of the key in a single pass. The same selection is shared by Alice, Bob and Eve
+def sample_selection(key_length, sample_size, rng=None):
+    rng = get_rng(rng)
+    in_sample = np.zeros(key_length, dtype=bool)
+    in_sample[rng.permutation(key_length)[:sample_size]] = True
+    #Positions of the sample and positions of the bits that stay in the key
+    return np.flatnonzero(in_sample), np.flatnonzero(~in_sample)
@@ -0,0 +1,159 @@
+from qkd_keys import PackedKey, pack_bits
+import numpy as np
+import hashlib
+import json
+import sys
+import os
+
+#OUTPUT OF THE KEYS
+#For hundreds of thousands of bits, printing the keys as lists takes longer than the simulation and floods the logs.
+#The scripts show the keys in one of three modes:
+#   summary   -> length, fraction of ones and fingerprint of every key
+#   truncated -> the first TRUNCATED_BITS bits of every key and its fingerprint
+#   full      -> every key is written to a binary file instead of the screen, and its summary is printed
+#The fingerprint is the start of the SHA-256 of the length and the packed bits of the key, so two runs (or Alice and
+#Bob) have the same key if and only if they have the same fingerprint, with no need to compare the bits.
+#The mode is chosen with the environment variable QKD_OUTPUT (summary by default) and the binary file of the full mode
+#with QKD_KEYS_FILE. Every run of a script writes its own file, named after the run (keys_bb84_pns.bin, keys_decoy.bin...
+#for QKD_KEYS_FILE=keys.bin), so a script with several runs does not overwrite the keys of the first ones.
+#The binary file starts with a line of JSON with the name, length, offset and fingerprint of every key, followed by the
+#packed bits of the keys (8 bits per byte, the first bit in the most significant bit, as np.packbits). A key can be read
+#back with read_keys, or lazily with np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(bytes,)).
+
+#Output modes
+OUTPUT_MODES = ("summary", "truncated", "full")
+#Output mode of the scripts
+OUTPUT_MODE = os.environ.get("QKD_OUTPUT", "summary")
+#Binary file of the keys in the full mode
+KEYS_FILE = os.environ.get("QKD_KEYS_FILE", "keys.bin")
+#Bits of every key shown in the truncated mode
+TRUNCATED_BITS = 64
+#Hexadecimal digits of the fingerprints
+FINGERPRINT_DIGITS = 16
+#First bytes of the binary file of the keys
+KEYS_FILE_FORMAT = "qkd-keys-1"
+
+#Function to validate the output mode
+def validate_output_mode(mode):
+    if mode not in OUTPUT_MODES:
+        sys.exit(f"ERROR: Unknown output mode. Choose one of {list(OUTPUT_MODES)}. Entered value: {mode}")
+
+    return None
+
+#Function to get the binary file of the keys of the run name in the full mode, next to QKD_KEYS_FILE
+def keys_file(name):
+    root, extension = os.path.splitext(KEYS_FILE)
+
+    return f"{root}_{name}{extension}"
+
+#Function to compute the fingerprint of a key from its length and its packed bits
+def key_fingerprint(key):
+    key = key if isinstance(key, PackedKey) else PackedKey(key)
+    digest = hashlib.sha256(key.length.to_bytes(8, "little"))
+    digest.update(key.data[:(key.length + 7)//8].tobytes())
+
+    return digest.hexdigest()[:FINGERPRINT_DIGITS]
+
+#Function to describe a key by its length, its fraction of ones and its fingerprint
+def key_summary(key):
+    key = key if isinstance(key, PackedKey) else PackedKey(key)
+    ones = key.count_ones()/key.length if key.length else 0.0
+
+    return f"{key.length} bits, {np.round(ones*100,2)} % ones, fingerprint {key_fingerprint(key)}"
+
+#Function to show the first bits of a key followed by how many are left and its fingerprint
+def truncated_key(key, bits=TRUNCATED_BITS):
+    key = key if isinstance(key, PackedKey) else PackedKey(key)
+    shown = "".join(str(bit) for bit in key[:bits].tolist())
+    if key.length <= bits:
+        return f"{shown} (fingerprint {key_fingerprint(key)})"
+
+    return f"{shown}... ({key.length - bits} more bits, fingerprint {key_fingerprint(key)})"
+
+#Function to write keys (a dictionary name -> key) to a binary file. It gives the header written at the start of it
+def write_keys(keys, path=None):
+    path = path or KEYS_FILE
+    keys = {name: key if isinstance(key, PackedKey) else PackedKey(key) for name, key in keys.items()}
+    entries = {}
+    offset = 0
+    for name, key in keys.items():
+        entries[name] = {"length": key.length, "offset": offset, "fingerprint": key_fingerprint(key)}
+        offset += (key.length + 7)//8
+    #The offsets in the file count the header, whose size depends on the offsets written in it. The header only grows
+    #with its size, so it is rebuilt until its size no longer changes
+    header_size = 0
+    while True:
+        text = json.dumps({"format": KEYS_FILE_FORMAT, "keys": {name: {**entry, "offset": entry["offset"] + header_size}
+                                                                for name, entry in entries.items()}}) + "\n"
+        if len(text.encode()) == header_size:
+            break
+        header_size = len(text.encode())
+
+    with open(path, "wb") as f:
+        f.write(text.encode())
+        for key in keys.values():
+            f.write(key.data[:(key.length + 7)//8].tobytes())
+
+    return json.loads(text)
+
+#Function to read the header of a binary file of keys
+def read_keys_header(path):
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+    if header.get("format") != KEYS_FILE_FORMAT:
+        sys.exit(f"ERROR: The file {path} is not a file of keys written by qkd_output")
+
+    return header
+
+#Function to read the keys of a binary file. Only the packed bits of every key are read, through np.memmap
+def read_keys(path):
+    keys = {}
+    for name, entry in read_keys_header(path)["keys"].items():
+        n_bytes = (entry["length"] + 7)//8
+        data = np.memmap(path, dtype=np.uint8, mode="r", offset=entry["offset"], shape=(n_bytes,)) if n_bytes else ()
+        keys[name] = PackedKey.from_packed(data, entry["length"])
+
+    return keys
+
+#Sink of the blocks of keys of the streaming mode. Every block is packed as it arrives, keeping the bits that do not
+#fill a whole byte for the next block, so the keys are kept packed and can be written to a binary file at the end
+class KeyCollector:
+
+    def __init__(self, names=("Alice", "Bob", "Eve")):
+        self.names = names
+        self.chunks = {name: [] for name in names}
+        self.carry = {name: np.zeros(0, dtype=np.uint8) for name in names}
+
+    def __call__(self, *blocks):
+        for name, block in zip(self.names, blocks):
+            bits = np.concatenate([self.carry[name], np.asarray(block, dtype=np.uint8)])
+            whole = bits.size - bits.size % 8
+            self.chunks[name].append(np.packbits(bits[:whole]))
+            self.carry[name] = bits[whole:]
+
+    #Function to get the keys received so far
+    def keys(self):
+        keys = {}
+        for name in self.names:
+            data = np.concatenate(self.chunks[name] + [pack_bits(self.carry[name])])
+            keys[name] = PackedKey.from_packed(data, 8*sum(chunk.size for chunk in self.chunks[name]) + self.carry[name].size)
+
+        return keys
+
+#Function to show keys (a dictionary name -> key) in the output mode. labels gives the text shown before every key.
+#In the full mode the keys are written to the binary file path and only their summary is shown
+def print_keys(keys, labels, mode=None, path=None):
+    mode = mode or OUTPUT_MODE
+    validate_output_mode(mode)
+    if mode == "full":
+        path = path or KEYS_FILE
+        write_keys(keys, path)
+    for name, key in keys.items():
+        if mode == "truncated":
+            print(f"{labels.get(name, name)} = {truncated_key(key)}")
+        else:
+            print(f"{labels.get(name, name)} = {key_summary(key)}")
+    if mode == "full":
+        print(f"Keys written to {path}")
+
+    return None
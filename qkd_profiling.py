@@ -0,0 +1,168 @@
+from contextlib import contextmanager
+import functools
+import tracemalloc
+import cProfile
+import resource
+import atexit
+import json
+import time
+import sys
+import os
+
+#STAGE-LEVEL PROFILING OF THE PROTOCOLS
+#The protocols of qkd_core mark their stages (encoding, measurements, sifting, sampling, QBER...) and the scripts mark
+#the printing of the keys. When profiling is enabled, every stage reports its wall time, the pulses it processed and its
+#throughput in pulses/s, the peak of memory allocated during the stage (traced by tracemalloc, NumPy arrays included),
+#the net number of memory blocks it left allocated and the peak RSS of the process when it ended. Stages can be nested,
+#and a stage is named by the path of the stages that contain it, for example bb84_pns/measure_Bob. Stages run several
+#times (several trials, or Bob and Eve measuring) are added up.
+#Profiling is disabled by default and then the stages cost nothing. It is enabled with enable(), with the --profile
+#option of the runners or with the environment variable QKD_PROFILE, which holds the path of the JSON report written
+#when the program ends. With QKD_PROFILE_PSTATS (or --pstats) a cProfile of every stage is also written to that folder
+#as <stage>.pstats, to be read with the pstats module or snakeviz.
+
+#Whether the stages are measured
+_enabled = False
+#JSON report written when the program ends, if any
+_report_path = None
+#Folder of the cProfile of every stage, if any
+_pstats_dir = None
+#Measurements added up for every stage, by path
+_stages = {}
+#Stages open at the moment, from the outermost
+_open = []
+#cProfile of every stage, by path
+_profiles = {}
+
+#Function to enable profiling. The report is written to report when the program ends, and the cProfile of every stage
+#to the folder pstats_dir
+def enable(report=None, pstats_dir=None):
+    global _enabled, _report_path, _pstats_dir
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if report is not None and _report_path is None:
+        atexit.register(write_report)
+    _enabled = True
+    _report_path = report or _report_path
+    _pstats_dir = pstats_dir or _pstats_dir
+
+    return None
+
+#Function to disable profiling. The measurements taken so far are kept
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    return None
+
+#Function to forget the measurements taken so far
+def reset():
+    _stages.clear()
+    _profiles.clear()
+
+    return None
+
+#Function to get the peak resident memory of the process in MB. Linux gives it in kB and macOS in bytes
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak/2**20 if sys.platform == "darwin" else peak/2**10
+
+#Context of a stage of pulses pulses. The pulses can also be added to the dictionary given by the context, when they
+#are only known at the end of the stage
+@contextmanager
+def stage(name, pulses=0):
+    if not _enabled:
+        yield {"pulses": pulses}
+        return
+    path = "/".join([frame["name"] for frame in _open] + [name])
+    #The peak of tracemalloc is global, so the peak of the stage that contains this one is saved before resetting it
+    current, peak = tracemalloc.get_traced_memory()
+    if _open:
+        _open[-1]["peak"] = max(_open[-1]["peak"], peak)
+        if _pstats_dir:
+            _profiles[_open[-1]["path"]].disable()
+    tracemalloc.reset_peak()
+    frame = {"name": name, "path": path, "pulses": pulses, "start_memory": current, "peak": current,
+             "blocks": sys.getallocatedblocks()}
+    _open.append(frame)
+    if _pstats_dir:
+        _profiles.setdefault(path, cProfile.Profile()).enable()
+    start = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        wall = time.perf_counter() - start
+        if _pstats_dir:
+            _profiles[path].disable()
+        _open.pop()
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        record = _stages.setdefault(path, {"calls": 0, "wall_s": 0.0, "pulses": 0, "peak_alloc_mb": 0.0,
+                                           "net_blocks": 0, "peak_rss_mb": 0.0})
+        record["calls"] += 1
+        record["wall_s"] += wall
+        record["pulses"] += int(frame["pulses"])
+        record["peak_alloc_mb"] = max(record["peak_alloc_mb"], (peak - frame["start_memory"])/2**20)
+        record["net_blocks"] += sys.getallocatedblocks() - frame["blocks"]
+        record["peak_rss_mb"] = max(record["peak_rss_mb"], peak_rss_mb())
+        #The stage that contains this one goes on measuring its own peak and its cProfile
+        if _open:
+            _open[-1]["peak"] = max(_open[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            if _pstats_dir:
+                _profiles[_open[-1]["path"]].enable()
+
+#Function to decorate a protocol run, so the whole run is measured as a stage. The pulses of the stage are the ones
+#given in the result of the run
+def profiled(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name) as frame:
+                result = function(*args, **kwargs)
+                frame["pulses"] = result.get("pulses", 0)
+
+            return result
+        return wrapper
+
+    return decorator
+
+#Function to get the report of the stages measured so far, with the throughput of every stage
+def report():
+    stages = {}
+    for path, record in _stages.items():
+        stages[path] = {**record, "pulses_per_s": record["pulses"]/record["wall_s"] if record["pulses"] and record["wall_s"] else None}
+
+    return {"command": sys.argv, "peak_rss_mb": peak_rss_mb(), "stages": stages}
+
+#Function to write the report as JSON to path (by default the one given when profiling was enabled) and the cProfile of
+#every stage to the pstats folder
+def write_report(path=None):
+    path = path or _report_path
+    result = report()
+    if path:
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+    if _pstats_dir:
+        os.makedirs(_pstats_dir, exist_ok=True)
+        for name, profile in _profiles.items():
+            profile.dump_stats(os.path.join(_pstats_dir, name.replace("/", ".") + ".pstats"))
+
+    return result
+
+#Function to print the report on the screen as a table, one line per stage
+def print_report(result=None):
+    result = result or report()
+    print(f"{'stage':<40} {'calls':>6} {'wall s':>9} {'pulses/s':>12} {'peak alloc MB':>14} {'net blocks':>11} {'RSS MB':>8}")
+    for path, record in result["stages"].items():
+        rate = f"{record['pulses_per_s']:.3g}" if record["pulses_per_s"] else "-"
+        print(f"{path:<40} {record['calls']:>6} {record['wall_s']:>9.4f} {rate:>12} {record['peak_alloc_mb']:>14.2f} {record['net_blocks']:>11} {record['peak_rss_mb']:>8.1f}")
+
+    return None
+
+
+#Profiling enabled from the environment, so the interactive scripts can be profiled without changing them
+if os.environ.get("QKD_PROFILE"):
+    enable(os.environ["QKD_PROFILE"], os.environ.get("QKD_PROFILE_PSTATS") or None)
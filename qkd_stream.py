@@ -0,0 +1,113 @@
+from qkd_numpy import get_rng, encode_message_numpy, measure_message_numpy
+from qkd_profiling import stage
+import numpy as np
+import math
+
+#STREAMING BB84 PIPELINE UNDER A PNS ATTACK
+#Every stage of the protocol (Alice's source, the fiber/PNS channel, Bob's measurement, Eve's measurement,
+#sifting and QBER accumulation) works on blocks of at most chunk_size pulses, chained as generators.
+#Only one block is alive at a time, so the memory used does not depend on the number of pulses n and
+#runs of 1e9 pulses or more (a full day of a GHz source) can be simulated.
+#Every block of every stage is marked for the profiling of qkd_profiling. The marks only cover the work on the block,
+#not the yield, so the stages of the chained generators never overlap and add up over the whole run.
+
+#Function for the channel. For each block of raw pulses sent by Alice it gives how many of them reach Bob.
+#Whether a pulse survives does not depend on the bit or basis it carries, so only the surviving pulses are
+#generated afterwards. Each block of raw pulses has about chunk_size survivors and is split if it has more
+def channel_counts(n, transmittance, chunk_size, rng=None):
+    rng = get_rng(rng)
+    #Raw pulses per block, so that about chunk_size of them reach Bob
+    block_size = max(1, int(chunk_size/transmittance)) if transmittance > 0 else n
+    sent = 0
+
+    while sent < n:
+        size = min(block_size, n - sent)
+        arrived = int(rng.binomial(size, transmittance))
+        #Keep every block under chunk_size pulses
+        while arrived > 0:
+            piece = min(arrived, chunk_size)
+            yield piece
+            arrived -= piece
+        sent += size
+
+#Function for Alice's source. For every block of pulses that reach Bob it gives her random bits and bases
+def alice_source(counts, rng=None):
+    rng = get_rng(rng)
+    for count in counts:
+        with stage("source", count):
+            bits = rng.integers(0, 2, size=count, dtype=np.uint8)
+            bases = rng.integers(0, 2, size=count, dtype=np.uint8)
+        yield bits, bases
+
+#Function for the measurements. Bob measures each block in random bases and Eve, who stored the photons
+#stolen from multiphoton pulses, measures the same block in Bob's bases once they are announced
+def measurement_stage(blocks, measure, rng=None):
+    rng = get_rng(rng)
+    for bits, bases_Alice in blocks:
+        with stage("measure", bits.size):
+            message = encode_message_numpy(bits, bases_Alice)
+            bases_Bob = rng.integers(0, 2, size=bits.size, dtype=np.uint8)
+            results_Bob = np.asarray(measure(message, bases_Bob), dtype=np.uint8)
+            results_Eve = np.asarray(measure(message, bases_Bob), dtype=np.uint8)
+        yield bits, bases_Alice, bases_Bob, results_Bob, results_Eve
+
+#Function to hand every measured block to pulse_sink before the sifting, for example to export the pulses of the run
+#with qkd_export.RunWriter. The blocks go on unchanged to the next stage
+def export_stage(blocks, pulse_sink):
+    for bits, bases_Alice, bases_Bob, results_Bob, results_Eve in blocks:
+        with stage("export", bits.size):
+            pulse_sink(bits_Alice=bits, bases_Alice=bases_Alice, bases_Bob=bases_Bob, results_Bob=results_Bob,
+                       results_Eve=results_Eve, sift_mask=bases_Alice == bases_Bob)
+        yield bits, bases_Alice, bases_Bob, results_Bob, results_Eve
+
+#Function for the sifting. Only the pulses where Alice's and Bob's bases match are kept.
+#The number of pulses of the block before sifting is also given to count the pulses that reached Bob
+def sifting_stage(blocks):
+    for bits, bases_Alice, bases_Bob, results_Bob, results_Eve in blocks:
+        with stage("sift", bits.size):
+            keep = bases_Alice == bases_Bob
+            sifted = bits[keep], results_Bob[keep], results_Eve[keep]
+        yield (bits.size, *sifted)
+
+#Function to run the whole streaming pipeline and accumulate its statistics.
+#Each sifted bit goes to the QBER sample with probability sample_fraction, as the 1/3 sample of the scripts does.
+#If key_sink is given, it receives every block of the final keys (Alice, Bob, Eve), for example to write them to a file.
+#If pulse_sink is given, it receives the arrays of every block of pulses that reach Bob by name
+def stream_bb84_pns(n, transmittance, chunk_size, measure=None, sample_fraction=1/3, key_sink=None, rng=None,
+                    pulse_sink=None):
+    rng = get_rng(rng)
+    if measure is None:
+        measure = lambda message, bases: measure_message_numpy(message, bases, rng)
+    counts = channel_counts(n, transmittance, chunk_size, rng)
+    blocks = measurement_stage(alice_source(counts, rng), measure, rng)
+    if pulse_sink is not None:
+        blocks = export_stage(blocks, pulse_sink)
+    blocks = sifting_stage(blocks)
+    stats = {"pulses_received": 0, "sifted_length": 0, "sample_length": 0, "sample_errors": 0,
+             "final_key_length": 0, "Eve_errors": 0, "chunks": 0}
+
+    #The whole run is a stage, which holds the stages of its blocks
+    with stage("bb84_pns_stream") as frame:
+        for received, bits_Alice, bits_Bob, bits_Eve in blocks:
+            with stage("accumulate", bits_Alice.size):
+                in_sample = rng.random(bits_Alice.size) < sample_fraction
+                stats["chunks"] += 1
+                stats["pulses_received"] += received
+                stats["sifted_length"] += bits_Alice.size
+                stats["sample_length"] += int(np.count_nonzero(in_sample))
+                stats["sample_errors"] += int(np.count_nonzero(bits_Alice[in_sample] != bits_Bob[in_sample]))
+                #The rest of the sifted bits form the final key
+                key = ~in_sample
+                stats["final_key_length"] += int(np.count_nonzero(key))
+                stats["Eve_errors"] += int(np.count_nonzero(bits_Alice[key] != bits_Eve[key]))
+                if key_sink is not None:
+                    key_sink(bits_Alice[key], bits_Bob[key], bits_Eve[key])
+        frame["pulses"] = stats["pulses_received"]
+
+    #QBER is the number of errors counted in the sample divided by the sample length. Nothing measured gives NaN, as
+    #qkd_core.QBER and qkd_core.Eve_information do, instead of no errors
+    stats["QBER"] = stats["sample_errors"]/stats["sample_length"] if stats["sample_length"] else math.nan
+    #Fraction of the final key that Eve knows
+    stats["Eve_information"] = 1 - stats["Eve_errors"]/stats["final_key_length"] if stats["final_key_length"] else math.nan
+
+    return stats
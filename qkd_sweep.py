@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+from qkd_montecarlo import DEFAULT_PARAMETERS, QUANTITIES, SCENARIOS, run_trials
+from qkd_cache import ResultCache, cache_key
+import qkd_core as core
+import qkd_profiling
+import qkd_export
+import numpy as np
+import itertools
+import argparse
+import hashlib
+import math
+import csv
+import sys
+import os
+
+#PARALLEL PARAMETER SWEEP OVER MU, ETA_DET, ALPHA AND THE FIBER LENGTH L
+#The PNS critical length l_BB84 and the number of pulses that reach Bob in every protocol only depend on
+#(mu, eta_det, alpha, l). The sweep evaluates them at every point of a grid of those parameters and, if scenarios are
+#given, also runs the Monte Carlo trials of every scenario at each point. Points are evaluated in a pool of processes
+#and every result is appended to a single CSV table as soon as it is ready, so an interrupted sweep loses nothing.
+#Every row also holds the settings of the run (n, the decoy-state parameters, the trials and the seed). When the sweep
+#is run again with the same table, the points already in it with the same settings are skipped, and points with other
+#settings are computed and appended to it. Points with Monte Carlo
+#scenarios are also kept in the cache of results of qkd_cache, so a new table with points already computed (another
+#grid, or an output file that was removed) takes them from the cache instead of running their trials again. Points
+#with only the analytic quantities are computed again, which is faster than reading them and would fill the cache.
+#The CSV table can also be written as Parquet at the end of the sweep (--parquet, needs pyarrow), and both are read
+#back as NumPy columns with qkd_export.read_table.
+
+#Parameters of the grid, in the order they appear in the table
+SWEEP_PARAMETERS = ("mu", "eta_det", "alpha", "l")
+#Settings of the run, the same for every point of a sweep, written after the parameters of the grid
+RUN_SETTINGS = ("n", "mu_decoy", "percent_decoy", "percent_signal", "trials", "seed")
+#Analytic quantities computed at every point
+ANALYTIC_COLUMNS = ("P_2_or_more", "delta_BB84", "l_BB84", "pns_undetected", "R_raw_pns", "n_pns_fibra", "n_fibra_sarg04")
+
+#Function to read the values of one parameter from the command line. "start:stop:num" gives num values evenly
+#spaced from start to stop (both included) and "v1,v2,..." gives the values listed
+def parse_values(text):
+    try:
+        if ":" in text:
+            start, stop, num = text.split(":")
+            return [float(v) for v in np.linspace(float(start), float(stop), int(num))]
+        return [float(v) for v in text.split(",")]
+    except ValueError:
+        sys.exit(f"ERROR: Values must be 'start:stop:num' or a list 'v1,v2,...'. Entered value: {text}")
+
+#Function to build every point of the grid. grids gives the list of values of each parameter of SWEEP_PARAMETERS
+def grid_points(grids):
+    values = [[float(v) for v in grids[name]] for name in SWEEP_PARAMETERS]
+
+    return [dict(zip(SWEEP_PARAMETERS, point)) for point in itertools.product(*values)]
+
+#Function to identify a point of the grid. Values are compared as floats, the same way they are read back from the table
+def point_key(point):
+    return tuple(float(point[name]) for name in SWEEP_PARAMETERS)
+
+#Function to identify a row of the table by its point and the settings of the run that computed it
+def row_key(row):
+    return tuple(float(row[name]) for name in SWEEP_PARAMETERS + RUN_SETTINGS)
+
+#Function to get the settings of a run, as they are written in every row of the table
+def run_settings(params, trials, seed):
+    return {**{name: params[name] for name in RUN_SETTINGS[:4]}, "trials": trials, "seed": seed}
+
+#Function to get the seed of the trials of a point from the seed of the sweep and the point itself, so every point
+#gets the same trials whatever order or process it runs in, and skipped points do not change the rest
+def point_seed(seed, point):
+    digest = hashlib.sha256(repr(point_key(point)).encode()).digest()
+
+    return [seed, *np.frombuffer(digest[:16], dtype=np.uint32).tolist()]
+
+#Function to build the columns of the table for the scenarios run at every point
+def table_columns(scenarios):
+    columns = list(SWEEP_PARAMETERS) + list(RUN_SETTINGS) + list(ANALYTIC_COLUMNS) + ["status"]
+    for scenario in scenarios:
+        for name in QUANTITIES[scenario]:
+            columns += [f"{scenario}_{name}_mean", f"{scenario}_{name}_ci_low", f"{scenario}_{name}_ci_high"]
+
+    return columns
+
+#Function to compute the analytic quantities of a point. pns_undetected tells if the fiber is long enough
+#(l >= l_BB84) for Eve to hide the PNS attack behind the losses of the channel
+def analytic_quantities(params):
+    pns = core.pns_quantities(params["mu"], params["eta_det"], params["n"], params["alpha"])
+
+    return {"P_2_or_more": pns["P_2_or_more"], "delta_BB84": pns["delta_BB84"], "l_BB84": pns["l_BB84"],
+            "pns_undetected": int(params["l"] >= pns["l_BB84"]), "R_raw_pns": pns["R_raw_pns"],
+            "n_pns_fibra": pns["n_pns_fibra"],
+            "n_fibra_sarg04": core.fiber_pulses(params["mu"], params["eta_det"], params["n"], params["alpha"], params["l"])}
+
+#Function executed by the processes of the pool. It evaluates one point of the grid. The trials of the point run in
+#the same process, since the points are already spread over the pool. If the parameters of the point are not valid
+#for a scenario, the error is written in the status column instead of stopping the whole sweep. The same happens at
+#degenerate points where the analytic quantities are not defined (for example mu = 0, with no multiphoton pulses),
+#whose analytic columns are NaN
+def evaluate_point(point, params, scenarios, trials, seed):
+    params = {**params, **point}
+    row = dict(point)
+    errors = []
+    try:
+        row.update(analytic_quantities(params))
+    except (ZeroDivisionError, ValueError) as error:
+        row.update({name: math.nan for name in ANALYTIC_COLUMNS})
+        errors.append(f"analytic: ERROR: The analytic quantities are not defined at this point ({error})")
+
+    for scenario in scenarios:
+        try:
+            summary = run_trials(scenario, params, trials, workers=1, seed=point_seed(seed, point))
+        except SystemExit as error:
+            errors.append(f"{scenario}: {error}")
+            continue
+        for name, stats in summary.items():
+            row[f"{scenario}_{name}_mean"] = stats["mean"]
+            row[f"{scenario}_{name}_ci_low"] = stats["ci_low"]
+            row[f"{scenario}_{name}_ci_high"] = stats["ci_high"]
+    row["status"] = "; ".join(errors) if errors else "ok"
+
+    return row
+
+#Function to read the rows already computed in a table, identified by their point and settings. A table with other
+#columns belongs to another sweep
+def completed_points(output, columns):
+    if not os.path.exists(output) or os.path.getsize(output) == 0:
+        return set()
+    with open(output, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != columns:
+            sys.exit(f"ERROR: The table {output} has the columns of another sweep. Use another output file. "
+                     f"Columns found: {reader.fieldnames}")
+        return {row_key(row) for row in reader}
+
+#Function to get the key of a point in the cache of results. Every point is identified by its parameters, the
+#scenarios run at it, their trials and the seed of the sweep
+def point_cache_key(point, params, scenarios, trials, seed):
+    return cache_key("sweep", {**params, **point, "scenarios": list(scenarios), "trials": trials}, seed, "numpy")
+
+#Function to run the sweep. Points already in the output table with the same settings are skipped and the new ones are
+#appended to it.
+#With a cache (a qkd_cache.ResultCache) the points with scenarios are looked for in it before evaluating them.
+#workers=1 evaluates the points in the current process. It gives the number of points computed
+def run_sweep(grids, output, params=None, scenarios=(), trials=20, workers=None, seed=0, cache=None):
+    params = {**DEFAULT_PARAMETERS, **(params or {})}
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            sys.exit(f"ERROR: Unknown scenario. Choose one of {list(SCENARIOS)}. Entered value: {scenario}")
+    columns = table_columns(scenarios)
+    done = completed_points(output, columns)
+    settings = run_settings(params, trials, seed)
+    points = [point for point in grid_points(grids) if row_key({**point, **settings}) not in done]
+    workers = workers or os.cpu_count()
+
+    #Only points with trials are worth keeping in the cache
+    cache = cache if scenarios else None
+
+    with open(output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval="")
+        if not done:
+            writer.writeheader()
+
+        #Function to write the row of a point evaluated now, with the settings of the run, to the table and to the cache
+        def write_row(row):
+            row = {**row, **settings}
+            writer.writerow(row)
+            if cache is not None:
+                point = {name: row[name] for name in SWEEP_PARAMETERS}
+                cache.put(point_cache_key(point, params, scenarios, trials, seed), row)
+
+        #Points already in the cache are written from it and not evaluated
+        pending = points
+        if cache is not None:
+            pending = []
+            for point in points:
+                row = cache.get(point_cache_key(point, params, scenarios, trials, seed))
+                if row is None:
+                    pending.append(point)
+                else:
+                    writer.writerow({**row, **settings})
+        if workers == 1:
+            rows = (evaluate_point(point, params, scenarios, trials, seed) for point in pending)
+            for row in rows:
+                write_row(row)
+        else:
+            #Points are sent in chunks so that the cost of sending them to the processes is small even for 1e4+ points
+            chunksize = max(1, len(pending)//(8*workers))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rows = pool.map(evaluate_point, pending, itertools.repeat(params), itertools.repeat(scenarios),
+                                itertools.repeat(trials), itertools.repeat(seed), chunksize=chunksize)
+                for i, row in enumerate(rows):
+                    write_row(row)
+                    #The table is flushed regularly so an interrupted sweep keeps the points already computed
+                    if i % 1000 == 999:
+                        f.flush()
+
+    return len(points)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep of the PNS, decoy-state and THA simulations")
+    parser.add_argument("output", help="CSV table of results. Points already in it are skipped")
+    parser.add_argument("--mu", default=str(DEFAULT_PARAMETERS["mu"]), help="values of μ, 'start:stop:num' or 'v1,v2,...'")
+    parser.add_argument("--eta_det", default=str(DEFAULT_PARAMETERS["eta_det"]), help="values of η_det")
+    parser.add_argument("--alpha", default=str(DEFAULT_PARAMETERS["alpha"]), help="values of α in dB/km")
+    parser.add_argument("--l", default=str(DEFAULT_PARAMETERS["l"]), help="values of the fiber length in km")
+    parser.add_argument("--scenarios", nargs="*", default=[], help=f"Monte Carlo scenarios to run at every point, from {list(SCENARIOS)}")
+    parser.add_argument("--trials", type=int, default=20, help="number of trials of every scenario at every point")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the trials of the sweep")
+    parser.add_argument("--cache", default=None, help="folder of the cache of results, QKD_CACHE or ~/.cache/qkd by default")
+    parser.add_argument("--no-cache", action="store_true", help="run everything again without using the cache of results")
+    parser.add_argument("--parquet", default=None, help="also write the whole table as Parquet to this file")
+    parser.add_argument("--profile", default=None, help="JSON report with the time, throughput and memory of every stage. The points are then evaluated in this process")
+    parser.add_argument("--pstats", default=None, help="folder for the cProfile of every stage, with --profile")
+    for name in ("n", "mu_decoy", "percent_decoy", "percent_signal"):
+        parser.add_argument(f"--{name}", type=float, default=DEFAULT_PARAMETERS[name])
+    args = parser.parse_args()
+    #The stages of points evaluated by other processes would not be measured
+    if args.profile:
+        qkd_profiling.enable(args.profile, args.pstats)
+        args.workers = 1
+    grids = {name: parse_values(getattr(args, name)) for name in SWEEP_PARAMETERS}
+    params = {name: getattr(args, name) for name in ("n", "mu_decoy", "percent_decoy", "percent_signal")}
+    params["n"] = int(params["n"])
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+
+    computed = run_sweep(grids, args.output, params, args.scenarios, args.trials, args.workers, args.seed, cache)
+    print(f"{computed} points computed and written to {args.output}")
+    if cache is not None:
+        print(cache.summary())
+    if args.parquet:
+        qkd_export.write_parquet(args.output, args.parquet)
+        print(f"Table written as Parquet to {args.parquet}")
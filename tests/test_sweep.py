@@ -0,0 +1,24 @@
+from pathlib import Path
+import sys
+
+#The tests are run from the tests folder or from the folder of the programs
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from qkd_export import read_table
+from qkd_sweep import run_sweep
+
+#TESTS OF THE PARAMETER SWEEP
+
+GRIDS = {"mu": [0.1, 0.2], "eta_det": [0.1], "alpha": [0.25], "l": [80]}
+
+#A table run again with the same settings skips its points, and with another n computes them again
+def test_rerun_with_other_n_recomputes_points(tmp_path):
+    output = str(tmp_path / "sweep.csv")
+    assert run_sweep(GRIDS, output, {"n": int(1e7)}, workers=1) == 2
+    assert run_sweep(GRIDS, output, {"n": int(1e7)}, workers=1) == 0
+    assert run_sweep(GRIDS, output, {"n": int(1e9)}, workers=1) == 2
+
+    table = read_table(output)
+    assert sorted(table["n"].tolist()) == [1e7, 1e7, 1e9, 1e9]
+    #The number of pulses that reach Bob grows with n
+    assert table["n_fibra_sarg04"][table["n"] == 1e9].min() > table["n_fibra_sarg04"][table["n"] == 1e7].max()